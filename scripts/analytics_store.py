@@ -0,0 +1,268 @@
+"""
+Base SQLite (optionnelle) des questions posées, pour les endpoints d'analyse : agrégations SQL
+et pagination par clé au lieu de la lecture de tous les fichiers questions_logs.
+
+Les fichiers JSONL restent la référence : chaque lot écrit par question_log.py est aussi inséré
+ici. Un client n'est servi par la base qu'après l'import de son historique
+(`python analytics_store.py import`), les autres restent servis par les fichiers.
+
+Réglages par variables d'environnement :
+- CHATBOT_ANALYTICS_STORE : "none" (par défaut), "shared" (une base pour tous les clients)
+  ou "per_client" (clients/<client_id>/analytics.sqlite3)
+- CHATBOT_ANALYTICS_DB : chemin de la base partagée (par défaut data/analytics/questions.sqlite3)
+"""
+import argparse
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from question_log import cursor_entry, list_months, parse_cursor, question_log, read_month
+
+CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
+STORE_MODE = os.environ.get("CHATBOT_ANALYTICS_STORE", "none")
+SHARED_DB_PATH = Path(os.environ.get("CHATBOT_ANALYTICS_DB", str(CLIENTS_PATH.parent / "analytics" / "questions.sqlite3")))
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS questions ("
+    " id INTEGER PRIMARY KEY, client_id TEXT NOT NULL, timestamp TEXT NOT NULL, period TEXT NOT NULL,"
+    " question TEXT NOT NULL, answer TEXT, user_ip TEXT)",
+    # Dédoublonnage : un import relancé (ou concurrent des écritures du backend) n'ajoute rien
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_unique ON questions(client_id, timestamp, question)",
+    "CREATE INDEX IF NOT EXISTS idx_questions_client_timestamp ON questions(client_id, period, timestamp, id)",
+    "CREATE TABLE IF NOT EXISTS imported_clients (client_id TEXT PRIMARY KEY, imported_at TEXT NOT NULL)",
+]
+
+
+def _row(client_id, entry):
+    timestamp = entry.get("timestamp", "")
+    return (client_id, timestamp, timestamp[:7], entry.get("question", ""), entry.get("answer"), entry.get("user_ip"))
+
+
+class AnalyticsStore:
+    def __init__(self, mode=STORE_MODE, shared_path=SHARED_DB_PATH):
+        self.mode = mode
+        self.shared_path = Path(shared_path)
+        self._lock = threading.Lock()
+        self._conns = {}
+
+    @property
+    def enabled(self):
+        return self.mode in ("shared", "per_client")
+
+    def _after_fork(self):
+        # Une connexion SQLite ne doit pas être partagée entre processus
+        self._conns = {}
+        self._lock = threading.Lock()
+
+    def _path(self, client_id):
+        if self.mode == "per_client":
+            return CLIENTS_PATH / client_id / "analytics.sqlite3"
+        return self.shared_path
+
+    def _db(self, client_id):
+        """Connexion (sous self._lock) à la base du client"""
+        path = self._path(client_id)
+        conn = self._conns.get(path)
+        if conn is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(path), check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._conns[path] = conn
+        return conn
+
+    # --- Écriture ---
+
+    def insert(self, client_id, entries, vectors=None):
+        if not self.enabled or not entries:
+            return
+        with self._lock:
+            db = self._db(client_id)
+            db.executemany(
+                "INSERT OR IGNORE INTO questions (client_id, timestamp, period, question, answer, user_ip)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [_row(client_id, entry) for entry in entries],
+            )
+            db.commit()
+
+    def mark_imported(self, client_id):
+        with self._lock:
+            db = self._db(client_id)
+            db.execute(
+                "INSERT OR REPLACE INTO imported_clients (client_id, imported_at) VALUES (?, ?)",
+                (client_id, datetime.now().isoformat()),
+            )
+            db.commit()
+
+    def delete_period(self, client_id, period):
+        if not self.enabled:
+            return
+        with self._lock:
+            db = self._db(client_id)
+            db.execute("DELETE FROM questions WHERE client_id = ? AND period = ?", (client_id, period))
+            db.commit()
+
+    def delete_client(self, client_id):
+        if self.mode != "shared":
+            # En mode per_client, la base disparaît avec le dossier du client
+            with self._lock:
+                conn = self._conns.pop(self._path(client_id), None)
+            if conn is not None:
+                conn.close()
+            return
+        with self._lock:
+            db = self._db(client_id)
+            db.execute("DELETE FROM questions WHERE client_id = ?", (client_id,))
+            db.execute("DELETE FROM imported_clients WHERE client_id = ?", (client_id,))
+            db.commit()
+
+    # --- Lecture ---
+
+    def serves(self, client_id):
+        """La base contient-elle tout l'historique du client (import effectué) ?"""
+        if not self.enabled:
+            return False
+        if self.mode == "per_client" and not self._path(client_id).exists():
+            return False
+        with self._lock:
+            row = self._db(client_id).execute(
+                "SELECT 1 FROM imported_clients WHERE client_id = ?", (client_id,)
+            ).fetchone()
+        return row is not None
+
+    def _query(self, client_id, sql, params):
+        with self._lock:
+            return self._db(client_id).execute(sql, params).fetchall()
+
+    def periods(self, client_id):
+        rows = self._query(
+            client_id, "SELECT DISTINCT period FROM questions WHERE client_id = ? ORDER BY period DESC", (client_id,)
+        )
+        return [period for (period,) in rows]
+
+    def count(self, client_id, period):
+        return self._query(
+            client_id, "SELECT COUNT(*) FROM questions WHERE client_id = ? AND period = ?", (client_id, period)
+        )[0][0]
+
+    def page(self, client_id, period, limit, offset=0, cursor=None):
+        """
+        Entrées du mois des plus récentes aux plus anciennes. `cursor` ("store:<id>" de la dernière
+        entrée reçue) permet une pagination par clé, sans parcourir les entrées précédentes comme
+        OFFSET ; un curseur de read_page (page lue dans les fichiers du mois, avant l'import du client)
+        reprend après l'horodatage de sa dernière entrée.
+        Retourne (entrées, curseur de la page suivante ou None s'il n'y a plus d'entrées).
+        """
+        if limit < 1 or offset < 0:
+            raise ValueError("limit doit être >= 1 et offset >= 0")
+        source, position = parse_cursor(cursor) if cursor else (None, None)
+        columns = "SELECT id, timestamp, question, answer, user_ip FROM questions WHERE client_id = ? AND period = ?"
+        if source == "store":
+            # Ordre chronologique et non par id : les entrées importées après coup ont des id plus grands
+            rows = self._query(
+                client_id,
+                columns + " AND (timestamp, id) < (SELECT timestamp, id FROM questions WHERE id = ?)"
+                " ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (client_id, period, position, limit + 1),
+            )
+        elif source is not None:
+            year, month = period.split("-")
+            entry = cursor_entry(client_id, year, month, source, position)
+            if entry is None:
+                raise ValueError(f"Curseur expiré : {cursor}")
+            rows = self._query(
+                client_id,
+                columns + " AND timestamp < ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (client_id, period, entry.get("timestamp", ""), limit + 1),
+            )
+        else:
+            rows = self._query(
+                client_id,
+                columns + " ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                (client_id, period, limit + 1, offset),
+            )
+        entries = [
+            {"timestamp": timestamp, "question": question, "answer": answer, "user_ip": user_ip, "client_id": client_id}
+            for _, timestamp, question, answer, user_ip in rows[:limit]
+        ]
+        return entries, (f"store:{rows[limit - 1][0]}" if len(rows) > limit else None)
+
+    def questions(self, client_id, period=None, limit=None):
+        """Questions du client (ou du mois) dans l'ordre chronologique ; `limit` : les plus récentes seulement"""
+        where, params = ("client_id = ? AND period = ?", (client_id, period)) if period else ("client_id = ?", (client_id,))
+        rows = self._query(
+            client_id,
+            f"SELECT question FROM (SELECT question, timestamp, id FROM questions WHERE {where}"
+            " ORDER BY timestamp DESC, id DESC LIMIT ?) ORDER BY timestamp, id",
+            (*params, -1 if limit is None else limit),
+        )
+        return [question for (question,) in rows]
+
+    def stats(self, client_id, now=None):
+        """Mêmes champs que /questions_stats, calculés par agrégation SQL"""
+        now = now or datetime.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        by_month = dict(self._query(
+            client_id, "SELECT period, COUNT(*) FROM questions WHERE client_id = ? GROUP BY period ORDER BY period", (client_id,)
+        ))
+        total, first, last = self._query(
+            client_id, "SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM questions WHERE client_id = ?", (client_id,)
+        )[0]
+        questions_today = self._query(
+            client_id,
+            "SELECT COUNT(*) FROM questions WHERE client_id = ? AND period = ? AND timestamp >= ? AND timestamp < ?",
+            (client_id, now.strftime("%Y-%m"), today.isoformat(), (today + timedelta(days=1)).isoformat()),
+        )[0][0]
+        return {
+            "total_questions": total,
+            "questions_today": questions_today,
+            "questions_this_month": by_month.get(now.strftime("%Y-%m"), 0),
+            "first_question_date": first,
+            "last_question_date": last,
+            "questions_by_month": by_month,
+        }
+
+
+# Base partagée par tout le processus
+analytics_store = AnalyticsStore()
+os.register_at_fork(after_in_child=analytics_store._after_fork)
+if analytics_store.enabled:
+    # Chaque lot écrit dans les fichiers JSONL est aussi inséré dans la base
+    question_log.sinks.append(analytics_store.insert)
+
+
+def import_client(client_id, store=analytics_store):
+    """Importe tous les mois (JSON et JSONL) du client, puis le marque comme servi par la base"""
+    total = 0
+    for year, month in list_months(client_id):
+        entries = read_month(client_id, year, month)
+        store.insert(client_id, entries)
+        total += len(entries)
+        print(f"✅ {client_id} {year}-{month} : {len(entries)} questions")
+    store.mark_imported(client_id)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Importe les questions_logs existants dans la base")
+    import_parser.add_argument("client_ids", nargs="*", help="Clients à importer (tous par défaut)")
+    args = parser.parse_args()
+
+    if not analytics_store.enabled:
+        parser.error("CHATBOT_ANALYTICS_STORE doit valoir \"shared\" ou \"per_client\"")
+    if args.command == "import":
+        client_ids = args.client_ids or sorted(
+            d.name for d in CLIENTS_PATH.iterdir() if d.is_dir() and (d / "config.json").exists()
+        )
+        total = sum(import_client(client_id) for client_id in client_ids)
+        print(f"{total} questions importées pour {len(client_ids)} clients")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_cache import normalize_question
+
+# Valeurs par défaut de la section "answer_cache" du config.json client :
+# "answer_cache": {"enabled": true, "similarity_threshold": 0.95, "ttl_seconds": 3600, "max_entries": 500}
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "similarity_threshold": 0.95,
+    "ttl_seconds": 3600,
+    "max_entries": 500,
+}
+
+
+def answer_cache_settings(client_conf):
+    """Paramètres du cache de réponses du client, ou None s'il n'est pas activé"""
+    conf = client_conf.get("answer_cache")
+    if not isinstance(conf, dict) or not conf.get("enabled"):
+        return None
+    return {**DEFAULT_SETTINGS, **conf}
+
+
+def paths_version(*paths):
+    """Version d'un ensemble de fichiers/dossiers : change si l'un d'eux est modifié ou remplacé"""
+    version = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            version.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+class _ClientAnswers:
+    def __init__(self, version):
+        self.version = version
+        self.entries = OrderedDict()  # question normalisée -> (vecteur normé, réponse, date)
+        self._matrix = None
+        self._keys = None
+
+    def matrix(self):
+        if self._matrix is None:
+            self._keys = list(self.entries)
+            self._matrix = np.stack([self.entries[k][0] for k in self._keys]) if self._keys else None
+        return self._keys, self._matrix
+
+    def changed(self):
+        self._matrix = None
+        self._keys = None
+
+
+class AnswerCache:
+    """Cache sémantique des réponses par client, invalidé quand config.json ou chroma_db changent"""
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _client(self, client_id, version):
+        answers = self._clients.get(client_id)
+        if answers is None or answers.version != version:
+            if answers is not None:
+                self.counters["invalidations"] += 1
+            answers = self._clients[client_id] = _ClientAnswers(version)
+        return answers
+
+    def _purge_expired(self, answers, ttl):
+        now = time.time()
+        expired = [k for k, (_, _, created) in answers.entries.items() if now - created > ttl]
+        for k in expired:
+            del answers.entries[k]
+        if expired:
+            answers.changed()
+
+    def lookup(self, client_id, version, question, embedding, settings):
+        with self._lock:
+            answers = self._client(client_id, version)
+            self._purge_expired(answers, settings["ttl_seconds"])
+            key = normalize_question(question)
+            entry = answers.entries.get(key)
+            if entry is None:
+                keys, matrix = answers.matrix()
+                if matrix is not None:
+                    query = _normalized(embedding)
+                    scores = matrix @ query
+                    best = int(np.argmax(scores))
+                    if scores[best] >= settings["similarity_threshold"]:
+                        key = keys[best]
+                        entry = answers.entries[key]
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            answers.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[1]
+
+    def store(self, client_id, version, question, embedding, answer, settings):
+        with self._lock:
+            answers = self._client(client_id, version)
+            answers.entries[normalize_question(question)] = (_normalized(embedding), answer, time.time())
+            while len(answers.entries) > settings["max_entries"]:
+                answers.entries.popitem(last=False)
+            answers.changed()
+
+    def invalidate(self, client_id=None):
+        with self._lock:
+            if client_id is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(client_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "clients": len(self._clients),
+                "entries": sum(len(a.entries) for a in self._clients.values()),
+            }
+
+
+def _normalized(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# Cache partagé par tout le processus
+answer_cache = AnswerCache()
@@ -0,0 +1,129 @@
+"""
+Point d'entrée ASGI : /ask est servi par le chemin asynchrone (chatbot_async),
+toutes les autres routes sont déléguées à l'application Flask.
+
+Lancement : uvicorn asgi:app --app-dir scripts --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+from backend import app as flask_app, API_KEY, record_answer
+from chatbot_async import chatbot_answer_async, inflight_questions
+from metrics import Counter, metrics, http_in_flight, http_request_seconds
+from warmup import warmer
+from log_maintenance import log_maintenance
+
+_flask = WsgiToAsgi(flask_app)
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, payload, status=200):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _client_ip(scope, headers):
+    forwarded = headers.get(b"x-forwarded-for")
+    if forwarded:
+        return forwarded.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else None
+
+
+async def timed_ask(scope, receive, send):
+    """Appelle ask en alimentant les métriques HTTP (mêmes séries que les routes Flask)"""
+    start = time.perf_counter()
+    status = [500]
+    http_in_flight.inc(endpoint="ask")
+
+    async def send_with_status(message):
+        if message["type"] == "http.response.start":
+            status[0] = message["status"]
+        await send(message)
+    try:
+        await ask(scope, receive, send_with_status)
+    finally:
+        http_in_flight.dec(endpoint="ask")
+        http_request_seconds.observe(
+            time.perf_counter() - start, endpoint="ask", method="POST", status=status[0]
+        )
+
+
+def async_inflight_metrics():
+    inflight = Counter("chatbot_async_singleflight_calls_total", "Questions identiques regroupées (chemin asynchrone)", ("role",))
+    for role, n in inflight_questions.counters.items():
+        inflight.inc(n, role=role)
+    return [inflight]
+
+
+metrics.register_collector(async_inflight_metrics)
+
+
+async def ask(scope, receive, send):
+    """Même contrat JSON que backend.ask"""
+    headers = dict(scope["headers"])
+    key = headers.get(b"x-api-key", b"").decode("latin-1")
+    if not key or key != API_KEY:
+        return await _send_json(send, {"error": "Clé API invalide ou manquante"}, 401)
+
+    try:
+        data = json.loads(await _read_body(receive) or b"{}")
+    except ValueError:
+        return await _send_json(send, {"error": "JSON invalide"}, 400)
+    if not isinstance(data, dict):
+        return await _send_json(send, {"error": "JSON invalide"}, 400)
+    question = data.get("question", "")
+    client_id = data.get("client_id", "default")  # client_id par défaut si absent
+
+    if not question:
+        return await _send_json(send, {"error": "Pas de question fournie"}, 400)
+
+    try:
+        answer, embedding = await chatbot_answer_async(question, client_id=client_id)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, record_answer, client_id, question, answer, _client_ip(scope, headers), embedding
+        )
+        return await _send_json(send, {"answer": answer})
+    except Exception as e:
+        return await _send_json(send, {"error": str(e)}, 500)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            warmer.start()
+            log_maintenance.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http" and scope["path"] == "/ask" and scope["method"] == "POST":
+        return await timed_ask(scope, receive, send)
+    return await _flask(scope, receive, send)
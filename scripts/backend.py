@@ -1,12 +1,27 @@
-from flask import Flask, request, jsonify
-from chatbot_requete import chatbot_response
+from flask import Flask, request, jsonify, Response, stream_with_context
+from chatbot_requete import chatbot_answer, chatbot_response_stream, chatbot_response_batch, inflight_questions
+from collection_registry import registry
+from embedding_cache import embedding_cache
+from answer_cache import answer_cache
+from client_config import load_client_config, invalidate_client_config, save_client_config
+from shared_files import file_lock, write_json_atomic
+from metrics import Counter as CounterMetric, Gauge as GaugeMetric, metrics, http_in_flight, http_request_seconds, timed
+import upstream
+from warmup import warmer
+from log_maintenance import log_maintenance
+from question_clusters import MAX_QUESTIONS as FREQUENT_MAX_QUESTIONS, frequent_results, group_similar_questions, question_words, top_keywords
+import question_vectors
+from question_log import question_log, count_entries, has_month, list_months, month_log_path, read_month, read_page
+from analytics_store import analytics_store
+import question_stats
 from flask_cors import CORS
 from pathlib import Path
 import os
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 from collections import Counter, defaultdict
 import re
+import time
 
 # Chemin des clients, défini par la variable d'environnement CHATBOT_CLIENTS_PATH
 CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
@@ -16,6 +31,32 @@ CORS(app)  # Autorise les requêtes cross-origin
 
 API_KEY = os.environ.get("CHATBOT_API_KEY", "chatbot-declic-default-key-2025")
 
+# Nombre maximal de questions par appel à /ask/batch
+MAX_BATCH_SIZE = int(os.environ.get("CHATBOT_MAX_BATCH_SIZE", "100"))
+
+@app.before_request
+def start_request_timer():
+    request.started_at = time.perf_counter()
+    http_in_flight.inc(endpoint=request.endpoint or "unknown")
+
+@app.after_request
+def observe_request(response):
+    # Pour /ask/stream, la durée mesurée s'arrête à l'envoi des en-têtes (cf. étape first_token)
+    started_at = getattr(request, "started_at", None)
+    if started_at is not None:
+        http_request_seconds.observe(
+            time.perf_counter() - started_at,
+            endpoint=request.endpoint or "unknown", method=request.method, status=response.status_code
+        )
+    return response
+
+@app.teardown_request
+def end_request(exc=None):
+    # Appelé deux fois pour les réponses en streaming (stream_with_context) : on ne décrémente qu'une fois
+    if getattr(request, "started_at", None) is not None:
+        request.started_at = None
+        http_in_flight.dec(endpoint=request.endpoint or "unknown")
+
 def require_api_key(f):
     from functools import wraps
     @wraps(f)
@@ -26,32 +67,17 @@ def require_api_key(f):
         return f(*args, **kwargs)
     return decorated
 
-def log_question(client_id, question, answer, user_ip=None):
-    """Enregistre une question posée par un utilisateur avec structure organisée"""
+def log_question(client_id, question, answer, user_ip=None, embedding=None):
+    """
+    Enregistre une question posée par un utilisateur avec structure organisée.
+    `embedding` (vecteur de la question) n'est pas écrit dans le log : il est transmis à question_vectors.py.
+    """
     client_dir = CLIENTS_PATH / client_id
     if not client_dir.exists():
         return
     
-    # Créer la structure: clients/client_id/questions_logs/2025/07/2025-07.json
+    # Structure: clients/client_id/questions_logs/2025/07/2025-07.jsonl (cf. question_log.py)
     now = datetime.now()
-    year = now.strftime("%Y")
-    month = now.strftime("%m")
-    month_filename = f"{year}-{month}.json"
-    
-    logs_dir = client_dir / "questions_logs" / year / month
-    logs_dir.mkdir(parents=True, exist_ok=True)
-    
-    log_file = logs_dir / month_filename
-    
-    # Charger les logs existants du mois
-    if log_file.exists():
-        with open(log_file, "r", encoding="utf-8") as f:
-            try:
-                logs = json.load(f)
-            except json.JSONDecodeError:
-                logs = []
-    else:
-        logs = []
     
     # Ajouter la nouvelle entrée
     log_entry = {
@@ -62,55 +88,16 @@ def log_question(client_id, question, answer, user_ip=None):
         "client_id": client_id
     }
     
-    logs.append(log_entry)
-    
-    # Sauvegarder en format lisible avec indentation
+    # Ajout en file d'attente : l'écriture (par lots, en fin de fichier) se fait hors de la requête
     try:
-        with open(log_file, "w", encoding="utf-8") as f:
-            json.dump(logs, f, ensure_ascii=False, indent=2)
+        question_log.append(client_id, log_entry, now, vector=embedding)
     except Exception as e:
         print(f"Erreur lors de l'enregistrement du log pour {client_id}: {e}")
 
-def cleanup_old_logs(client_id, months_to_keep=12):
-    """Supprime les logs de plus de X mois pour économiser l'espace"""
-    client_dir = CLIENTS_PATH / client_id
-    logs_base_dir = client_dir / "questions_logs"
-    
-    if not logs_base_dir.exists():
-        return
-    
-    cutoff_date = datetime.now() - timedelta(days=365)  # 1 an
-    
-    # Parcourir tous les dossiers d'années
-    for year_dir in logs_base_dir.iterdir():
-        if not year_dir.is_dir():
-            continue
-            
-        # Parcourir tous les dossiers de mois
-        for month_dir in year_dir.iterdir():
-            if not month_dir.is_dir():
-                continue
-                
-            try:
-                # Construire la date du mois
-                year_str = year_dir.name
-                month_str = month_dir.name
-                month_date = datetime.strptime(f"{year_str}-{month_str}", "%Y-%m")
-                
-                # Supprimer si trop ancien
-                if month_date < cutoff_date:
-                    import shutil
-                    shutil.rmtree(month_dir)
-                    print(f"🗑️  Supprimé logs anciens: {client_id}/{year_str}/{month_str}")
-                    
-            except ValueError:
-                continue
-    
-    # Nettoyer les dossiers d'années vides
-    for year_dir in logs_base_dir.iterdir():
-        if year_dir.is_dir() and not any(year_dir.iterdir()):
-            year_dir.rmdir()
-            print(f"🗑️  Supprimé dossier année vide: {client_id}/{year_dir.name}")
+def record_answer(client_id, question, answer, user_ip=None, embedding=None):
+    """Traitements après une réponse à /ask : log de la question (rétention et compression dans log_maintenance.py)"""
+    with timed("log", client_id):
+        log_question(client_id, question, answer, user_ip, embedding)
 
 @app.route("/ask", methods=["POST"])
 @require_api_key
@@ -123,21 +110,171 @@ def ask():
         return jsonify({"error": "Pas de question fournie"}), 400
 
     try:
-        answer = chatbot_response(question, client_id=client_id)
+        answer, embedding = chatbot_answer(question, client_id=client_id)
         
         # Logger la question et la réponse
         user_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-        log_question(client_id, question, answer, user_ip)
-        
-        # Nettoyage automatique des anciens logs (tous les 100 appels environ)
-        import random
-        if random.randint(1, 100) == 1:
-            cleanup_old_logs(client_id)
+        record_answer(client_id, question, answer, user_ip, embedding)
         
         return jsonify({"answer": answer})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/ask/batch", methods=["POST"])
+@require_api_key
+def ask_batch():
+    """
+    Plusieurs questions en un appel (pré-chauffage, tests QA du plugin WordPress)
+    Corps : {"items": [{"client_id": "...", "question": "..."}, ...]}
+    Réponse : {"results": [{"answer": "..."} | {"error": "..."}, ...]} dans l'ordre des items
+    """
+    data = request.get_json() or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Pas de questions fournies"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Trop de questions (maximum {MAX_BATCH_SIZE})"}), 400
+
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("question"):
+            results[i] = {"error": "Pas de question fournie"}
+        else:
+            valid.append(i)
+
+    try:
+        answers = chatbot_response_batch([
+            (items[i].get("client_id", "default"), items[i]["question"]) for i in valid
+        ])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    user_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
+    for i, result in zip(valid, answers):
+        embedding = result.pop("embedding", None)
+        results[i] = result
+        if "answer" in result:
+            record_answer(items[i].get("client_id", "default"), items[i]["question"], result["answer"], user_ip, embedding)
+
+    return jsonify({"results": results})
+
+def sse_event(event, payload):
+    """Formate un événement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route("/ask/stream", methods=["POST"])
+@require_api_key
+def ask_stream():
+    """Version streaming de /ask (Server-Sent Events) : sources, puis réponse token par token"""
+    data = request.get_json()
+    question = data.get("question", "")
+    client_id = data.get("client_id", "default")
+
+    if not question:
+        return jsonify({"error": "Pas de question fournie"}), 400
+
+    user_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
+
+    def generate():
+        answer = None
+        embedding = None
+        try:
+            for event, payload in chatbot_response_stream(question, client_id=client_id):
+                if event == "embedding":
+                    embedding = payload
+                elif event == "sources":
+                    yield sse_event("sources", payload)
+                elif event == "delta":
+                    yield sse_event("delta", {"text": payload})
+                elif event == "done":
+                    answer = payload
+                    yield sse_event("done", {"answer": payload})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+        # Logger la question une fois la réponse complète envoyée
+        if answer is not None:
+            record_answer(client_id, question, answer, user_ip, embedding)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/cache_stats", methods=["GET"])
+@require_api_key
+def cache_stats():
+    """Compteurs des caches du processus (collections ouvertes, embeddings)"""
+    return jsonify({
+        "collections": registry.snapshot(),
+        "embeddings": embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "inflight": inflight_questions.counters,
+        "upstream": upstream.snapshot()
+    })
+
+def cache_metrics():
+    """Compteurs existants des caches et des appels à l'API, convertis pour /metrics"""
+    embeddings = embedding_cache.stats()
+    embedding_events = CounterMetric("chatbot_embedding_cache_events_total", "Consultations du cache d'embeddings", ("result",))
+    for result in ("memory_hits", "disk_hits", "misses"):
+        embedding_events.inc(embeddings[result], result=result)
+
+    answers = answer_cache.stats()
+    answer_events = CounterMetric("chatbot_answer_cache_events_total", "Consultations du cache de réponses", ("result",))
+    for result in ("hits", "misses", "invalidations"):
+        answer_events.inc(answers[result], result=result)
+    answer_entries = GaugeMetric("chatbot_answer_cache_entries", "Réponses en cache")
+    answer_entries.set(answers["entries"])
+
+    collections = registry.snapshot()
+    collection_events = CounterMetric("chatbot_collections_events_total", "Activité du registre des index", ("event",))
+    for event in ("hits", "opens", "reopens", "evictions"):
+        collection_events.inc(collections[event], event=event)
+    collections_open = GaugeMetric("chatbot_collections_open", "Index ouverts")
+    collections_open.set(collections["open"])
+    collections_bytes = GaugeMetric("chatbot_collections_bytes", "Taille cumulée des index ouverts")
+    collections_bytes.set(collections["bytes"])
+
+    inflight = CounterMetric("chatbot_singleflight_calls_total", "Questions identiques regroupées", ("role",))
+    for role, n in inflight_questions.counters.items():
+        inflight.inc(n, role=role)
+
+    snapshot = upstream.snapshot()
+    upstream_calls = CounterMetric("chatbot_upstream_calls_total", "Appels à l'API par issue", ("kind", "model", "outcome"))
+    for row in snapshot["counters"]:
+        upstream_calls.inc(row["count"], kind=row["kind"], model=row["model"], outcome=row["outcome"])
+    breakers = GaugeMetric("chatbot_upstream_circuit_open", "Disjoncteur ouvert (1) ou fermé (0), additionné entre workers", ("model",))
+    for model, state in snapshot["breakers"].items():
+        breakers.set(1 if state == "open" else 0, model=model)
+
+    question_log_events = CounterMetric("chatbot_question_log_entries_total", "Écritures du journal des questions", ("event",))
+    for event, n in question_log.counters.items():
+        question_log_events.inc(n, event=event)
+
+    return [embedding_events, answer_events, answer_entries, collection_events, collections_open,
+            collections_bytes, inflight, upstream_calls, breakers, question_log_events]
+
+metrics.register_collector(cache_metrics)
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Métriques au format Prometheus (clé API en X-API-Key ou en Authorization: Bearer)"""
+    key = request.headers.get("X-API-Key")
+    authorization = request.headers.get("Authorization", "")
+    if not key and authorization.startswith("Bearer "):
+        key = authorization[len("Bearer "):]
+    if not key or key != API_KEY:
+        return jsonify({"error": "Clé API invalide ou manquante"}), 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Sonde du load balancer (sans clé API) : 503 tant que les clients prioritaires ne sont pas chargés"""
+    state = warmer.snapshot()
+    return jsonify(state), 200 if state["ready"] else 503
+
 @app.route("/clients", methods=["GET"])
 @require_api_key
 def list_clients():
@@ -152,8 +289,7 @@ def get_client_config(client_id):
     if not config_path.exists():
         return jsonify({"error": "Client ou config introuvable"}), 404
     try:
-        with open(config_path, "r", encoding="utf-8") as f:
-            return jsonify(json.load(f))
+        return jsonify(load_client_config(client_id, validated=False))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -177,13 +313,13 @@ def create_client():
     if not client_id:
         return jsonify({"error": "client_id manquant"}), 400
     client_dir = CLIENTS_PATH / client_id
-    if client_dir.exists():
+    try:
+        # mkdir sans exist_ok : un seul worker peut créer le client
+        client_dir.mkdir(parents=True)
+    except FileExistsError:
         return jsonify({"error": "Client existe déjà"}), 400
     try:
-        client_dir.mkdir(parents=True, exist_ok=True)
-        config_path = client_dir / "config.json"
-        with open(config_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        save_client_config(client_id, data)
         return jsonify({"success": True}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -196,8 +332,7 @@ def update_client_config(client_id):
         return jsonify({"error": "Client introuvable"}), 404
     data = request.get_json()
     try:
-        with open(config_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        save_client_config(client_id, data)
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -210,7 +345,9 @@ def delete_client(client_id):
     if not client_dir.exists():
         return jsonify({"error": "Client introuvable"}), 404
     try:
+        analytics_store.delete_client(client_id)
         shutil.rmtree(client_dir)
+        invalidate_client_config(client_id)
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -221,8 +358,8 @@ def update_manual_content(client_id):
     manual_path = CLIENTS_PATH / client_id / "manual_content.json"
     data = request.get_json()
     try:
-        with open(manual_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with file_lock(manual_path):
+            write_json_atomic(manual_path, data, indent=2)
         # Création du fichier should_index.txt à chaque modification du contenu manuel
         should_index_path = CLIENTS_PATH / client_id / "should_index.txt"
         with open(should_index_path, "w") as f:
@@ -253,6 +390,34 @@ def update_data(client_id):
     except subprocess.CalledProcessError as e:
         return jsonify({"success": False, "error": e.stderr}), 500
 
+def questions_page(client_id, year, month, default_limit):
+    """
+    Page du journal d'un mois, des questions les plus récentes aux plus anciennes, selon les
+    paramètres limit/offset ou cursor (next_cursor de la page précédente, de l'un ou l'autre moteur)
+    de la requête. ValueError (400) si les paramètres ou le curseur sont invalides.
+    """
+    limit = request.args.get('limit', default_limit, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    cursor = request.args.get('cursor')
+    period = f"{year}-{month}"
+    
+    if analytics_store.serves(client_id):
+        logs, next_cursor = analytics_store.page(client_id, period, limit, offset, cursor)
+        total = analytics_store.count(client_id, period)
+    else:
+        logs, next_cursor = read_page(client_id, year, month, limit, offset, cursor)
+        # Total tenu à jour par question_stats ; sinon comptage des lignes du mois
+        stats = question_stats.load(client_id)
+        total = stats["by_month"].get(period, 0) if stats else count_entries(client_id, year, month)
+    
+    return {
+        "questions": logs,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor
+    }
+
 @app.route("/clients/<client_id>/questions_log", methods=["GET"])
 @require_api_key
 def get_questions_log(client_id):
@@ -263,9 +428,9 @@ def get_questions_log(client_id):
     year = request.args.get('year', datetime.now().strftime("%Y"))
     month = request.args.get('month', datetime.now().strftime("%m"))
     
-    log_file = client_dir / "questions_logs" / year / month / f"{year}-{month}.json"
+    log_file = month_log_path(client_id, year, month)
     
-    if not log_file.exists():
+    if not has_month(client_id, year, month):
         return jsonify({
             "questions": [], 
             "total": 0, 
@@ -276,26 +441,15 @@ def get_questions_log(client_id):
         })
     
     try:
-        with open(log_file, "r", encoding="utf-8") as f:
-            logs = json.load(f)
-        
-        # Pagination
-        limit = request.args.get('limit', 50, type=int)
-        offset = request.args.get('offset', 0, type=int)
-        
-        # Inverser l'ordre pour avoir les plus récentes en premier
-        
-        paginated_logs = logs[offset:offset+limit]
-        
+        page = questions_page(client_id, year, month, default_limit=50)
         return jsonify({
-            "questions": paginated_logs,
-            "total": len(logs),
-            "limit": limit,
-            "offset": offset,
+            **page,
             "year": year,
             "month": month,
             "file_path": str(log_file.relative_to(client_dir))
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -303,38 +457,11 @@ def get_questions_log(client_id):
 @require_api_key
 def get_available_periods(client_id):
     """Liste toutes les périodes (années/mois) disponibles pour les logs"""
-    client_dir = CLIENTS_PATH / client_id
-    logs_base_dir = client_dir / "questions_logs"
+    if analytics_store.serves(client_id):
+        return jsonify({"periods": analytics_store.periods(client_id)})
     
-    if not logs_base_dir.exists():
-        return jsonify({"periods": []})
-    
-    periods = []
-    
-    # Parcourir la structure année/mois
-    for year_dir in sorted(logs_base_dir.iterdir(), reverse=True):
-        if not year_dir.is_dir():
-            continue
-            
-        year = year_dir.name
-        
-        for month_dir in sorted(year_dir.iterdir(), reverse=True):
-            if not month_dir.is_dir():
-                continue
-                
-            month = month_dir.name
-            log_file = month_dir / f"{year}-{month}.json"
-            
-            if log_file.exists():
-                # Compter le nombre de questions dans ce fichier
-                try:
-                    with open(log_file, "r", encoding="utf-8") as f:
-                        logs = json.load(f)
-                        question_count = len(logs)
-                except:
-                    question_count = 0
-                
-                periods.append(f"{year}-{month}")
+    # Mois ayant un journal (JSON ou JSONL), du plus récent au plus ancien, sans lire les fichiers
+    periods = [f"{year}-{month}" for year, month in reversed(list_months(client_id))]
     
     return jsonify({"periods": periods})
 
@@ -352,94 +479,14 @@ def get_available_periods_wp():
 @require_api_key
 def get_questions_stats(client_id):
     """Récupère les statistiques des questions pour un client"""
-    client_dir = CLIENTS_PATH / client_id
-    logs_base_dir = client_dir / "questions_logs"
-    
-    if not logs_base_dir.exists():
-        return jsonify({
-            "total_questions": 0,
-            "questions_today": 0,
-            "questions_this_month": 0,
-            "first_question_date": None,
-            "last_question_date": None,
-            "questions_by_month": {}
-        })
-    
-    all_logs = []
-    questions_by_month = {}
-    
-    # Parcourir tous les fichiers de logs pour ce client
-    for year_dir in logs_base_dir.iterdir():
-        if not year_dir.is_dir():
-            continue
-            
-        for month_dir in year_dir.iterdir():
-            if not month_dir.is_dir():
-                continue
-                
-            year = year_dir.name
-            month = month_dir.name
-            log_file = month_dir / f"{year}-{month}.json"
-            
-            if log_file.exists():
-                try:
-                    with open(log_file, "r", encoding="utf-8") as f:
-                        month_logs = json.load(f)
-                        all_logs.extend(month_logs)
-                        questions_by_month[f"{year}-{month}"] = len(month_logs)
-                except:
-                    continue
-    
-    total_questions = len(all_logs)
-    
-    if total_questions == 0:
-        return jsonify({
-            "total_questions": 0,
-            "questions_today": 0,
-            "questions_this_month": 0,
-            "first_question_date": None,
-            "last_question_date": None,
-            "questions_by_month": {}
-        })
-    
-    # Calculer les statistiques
-    now = datetime.now()
-    today = now.date()
-    current_month = now.strftime("%Y-%m")
-    
-    questions_today = 0
-    questions_this_month = questions_by_month.get(current_month, 0)
-    
-    timestamps = []
-    
-    for log in all_logs:
-        try:
-            log_datetime = datetime.fromisoformat(log["timestamp"])
-            timestamps.append(log_datetime)
-            
-            if log_datetime.date() == today:
-                questions_today += 1
-                
-        except:
-            continue
-    
-    # Dates de première et dernière question
-    if timestamps:
-        timestamps.sort()
-        first_question_date = timestamps[0].isoformat()
-        last_question_date = timestamps[-1].isoformat()
-    else:
-        first_question_date = None
-        last_question_date = None
-    
-    return jsonify({
-        "total_questions": total_questions,
-        "questions_today": questions_today,
-        "questions_this_month": questions_this_month,
-        "first_question_date": first_question_date,
-        "last_question_date": last_question_date,
-        "questions_by_month": questions_by_month
-    })
+    # Compteurs tenus à jour à chaque écriture du journal (cf. question_stats.py)
+    stats = question_stats.load(client_id)
+    if stats is None:
+        if analytics_store.serves(client_id):
+            return jsonify(analytics_store.stats(client_id))
+        # Premier accès : tout l'historique est compté une fois, puis enregistré
+        stats = question_stats.refresh(client_id)
+    return jsonify(question_stats.summary(stats))
 
 # Endpoint compatible avec le plugin WordPress (sans client_id dans l'URL)
 @app.route("/questions_stats", methods=["GET"])
@@ -471,10 +518,7 @@ def get_questions_log_wp():
     except ValueError:
         return jsonify({"error": "Format de période invalide, attendu: YYYY-MM"}), 400
     
-    client_dir = CLIENTS_PATH / client_id
-    log_file = client_dir / "questions_logs" / year / month / f"{year}-{month}.json"
-    
-    if not log_file.exists():
+    if not has_month(client_id, year, month):
         return jsonify({
             "questions": [], 
             "total": 0, 
@@ -482,24 +526,10 @@ def get_questions_log_wp():
         })
     
     try:
-        with open(log_file, "r", encoding="utf-8") as f:
-            logs = json.load(f)
-        
-        # Pagination
-        limit = request.args.get('limit', 1000, type=int)
-        offset = request.args.get('offset', 0, type=int)
-        
-        # Inverser l'ordre pour avoir les plus récentes en premier
-        
-        paginated_logs = logs[offset:offset+limit]
-        
-        return jsonify({
-            "questions": paginated_logs,
-            "total": len(logs),
-            "limit": limit,
-            "offset": offset,
-            "period": period
-        })
+        page = questions_page(client_id, year, month, default_limit=1000)
+        return jsonify({**page, "period": period})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -508,86 +538,72 @@ def get_questions_log_wp():
 def questions_frequent():
     """
     Endpoint pour obtenir les mots-clés fréquents et les questions similaires pour un client (et une période optionnelle)
-    GET /questions_frequent?client_id=...&period=AAAA-MM
+    GET /questions_frequent?client_id=...&period=AAAA-MM[&mode=semantic]
+    mode=semantic : groupes par similarité des embeddings et mots-clés, tenus à jour par question_vectors.py
+    sans relire les logs (regroupement lexical si aucun vecteur n'a été enregistré)
+    mode lexical : sur les CHATBOT_FREQUENT_MAX_QUESTIONS questions les plus récentes, résultat gardé
+    en mémoire tant qu'aucune nouvelle question n'a été enregistrée
     """
     client_id = request.args.get('client_id')
     period = request.args.get('period')  # format AAAA-MM
     if not client_id:
         return jsonify({"error": "client_id manquant"}), 400
-
-    client_dir = CLIENTS_PATH / client_id
-    logs_base_dir = client_dir / "questions_logs"
-    questions = []
-
-    # Récupérer les logs selon la période
     if period:
         try:
             year, month = period.split('-')
         except ValueError:
             return jsonify({"error": "Format de période invalide, attendu: YYYY-MM"}), 400
-        log_file = logs_base_dir / year / month / f"{year}-{month}.json"
-        if log_file.exists():
-            with open(log_file, "r", encoding="utf-8") as f:
-                logs = json.load(f)
-                questions = [log["question"] for log in logs if "question" in log]
-    else:
-        # Toutes périodes
-        for year_dir in logs_base_dir.iterdir():
-            if not year_dir.is_dir():
-                continue
-            for month_dir in year_dir.iterdir():
-                if not month_dir.is_dir():
-                    continue
-                log_file = month_dir / f"{year_dir.name}-{month_dir.name}.json"
-                if log_file.exists():
-                    with open(log_file, "r", encoding="utf-8") as f:
-                        logs = json.load(f)
-                        questions.extend([log["question"] for log in logs if "question" in log])
-
-    # Extraction des mots-clés (stopwords FR/EN, mots > 3 lettres)
-    stopwords = set([
-        'le','la','les','un','une','des','du','de','d','en','et','ou','a','au','aux','pour','par','sur','avec','sans','dans','ce','cette','ces','mon','ma','mes','ton','ta','tes','son','sa','ses','notre','nos','votre','vos','leur','leurs','je','tu','il','elle','on','nous','vous','ils','elles','y','est','suis','es','sont','êtes','été','être','ai','as','avons','avez','ont','avoir','fait','fais','faisons','faites','font','faire','plus','moins','très','peu','beaucoup','comment','quoi','quel','quelle','quels','quelles','qui','que','qu','où','quand','donc','si','là','ça','c','se','sa','aujourd','hui','the','and','or','but','for','not','are','is','was','were','be','been','being','have','has','had','do','does','did','of','to','in','on','at','by','with','from','as','an','it','this','that','these','those','i','you','he','she','we','they','my','your','his','her','its','our','their','me','him','them','us','can','will','just','so','if','then','than','too','very','all','any','some','no','nor','also','because','about','into','over','after','before','such','why','how','which','what','who','whom','where','when','again','once','here','there','each','own','same','other','more','most','own','same','other','more','most','s','t','d','ll','m','o','re','ve','y','ain','aren','couldn','didn','doesn','hadn','hasn','haven','isn','ma','mightn','mustn','needn','shan','shouldn','wasn','weren','won','wouldn'
-    ])
-    word_counter = Counter()
-    for q in questions:
-        # Nettoyage basique
-        q_clean = re.sub(r"[^\w\s]", " ", q.lower())
-        words = [w for w in q_clean.split() if len(w) > 3 and w not in stopwords]
-        word_counter.update(words)
-    keywords = [
-        {"word": word, "count": count}
-        for word, count in word_counter.most_common(15)
-    ]
-
-    # Regroupement des questions similaires (fuzzy matching simple)
-    from difflib import SequenceMatcher
-    min_similarity = 0.7
-    question_groups = []
-    used = set()
-    for i, q1 in enumerate(questions):
-        if i in used:
-            continue
-        group = [q1]
-        similar = []
-        for j, q2 in enumerate(questions):
-            if i != j and j not in used:
-                ratio = SequenceMatcher(None, q1.lower(), q2.lower()).ratio()
-                if ratio > min_similarity:
-                    similar.append(q2)
-                    used.add(j)
-        used.add(i)
-        question_groups.append({
-            "question": q1,
-            "count": 1 + len(similar),
-            "similar": similar
-        })
-    # Trier par nombre d'occurrences
-    question_groups = sorted(question_groups, key=lambda x: x["count"], reverse=True)[:10]
 
-    return jsonify({
-        "keywords": keywords,
-        "frequent_questions": question_groups
-    })
+    if request.args.get('mode') == "semantic":
+        semantic = question_vectors.frequent_questions(client_id, period, top=10)
+        if semantic is not None:
+            question_groups, word_counts = semantic
+            return jsonify({
+                "keywords": top_keywords(word_counts, 15),
+                "frequent_questions": question_groups,
+                "mode": "semantic"
+            })
+
+    # Regroupement refait seulement si question_stats a compté de nouvelles entrées depuis le dernier appel
+    stats = question_stats.load(client_id)
+    version = (stats["total"], stats["offsets"]) if stats else None
+    result = frequent_results.get((client_id, period), version)
+    if result is None:
+        questions = recent_questions(client_id, period)
+
+        # Extraction des mots-clés (stopwords FR/EN, mots > 3 lettres)
+        word_counter = Counter()
+        for q in questions:
+            word_counter.update(question_words(q))
+
+        result = {
+            "keywords": top_keywords(word_counter, 15),
+            # Regroupement des questions similaires (fuzzy matching, comparaisons limitées aux candidats probables)
+            "frequent_questions": group_similar_questions(questions, min_similarity=0.7, top=10),
+            "mode": "lexical"
+        }
+        frequent_results.put((client_id, period), version, result)
+    return jsonify(result)
+
+def recent_questions(client_id, period=None, limit=FREQUENT_MAX_QUESTIONS):
+    """Questions du mois (ou de tout l'historique) dans l'ordre chronologique, limitées aux `limit` plus récentes"""
+    if analytics_store.serves(client_id):
+        return analytics_store.questions(client_id, period, limit)
+    if period:
+        year, month = period.split('-')
+        months = [(year, month)] if has_month(client_id, year, month) else []
+    else:
+        months = list_months(client_id)
+    # Mois lus du plus récent au plus ancien, jusqu'à `limit` questions
+    chunks, count = [], 0
+    for year, month in reversed(months):
+        chunk = [log["question"] for log in read_month(client_id, year, month) if "question" in log]
+        chunks.append(chunk)
+        count += len(chunk)
+        if count >= limit:
+            break
+    questions = [q for chunk in reversed(chunks) for q in chunk]
+    return questions[-limit:]
 
 @app.route("/clients/<client_id>/update_logs", methods=["GET"])
 @require_api_key
@@ -820,6 +836,10 @@ def get_available_log_dates(client_id):
         return jsonify({"error": f"Erreur lors de la recherche des dates: {str(e)}"}), 500
 
 if __name__ == "__main__":
+    # Avec le reloader du mode debug, seul le processus enfant (WERKZEUG_RUN_MAIN) sert les requêtes
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        warmer.start()
+        log_maintenance.start()
     app.run(host="0.0.0.0", debug=True, port=5000)
 
 
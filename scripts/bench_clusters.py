@@ -0,0 +1,108 @@
+"""
+Mesure du regroupement des questions similaires de /questions_frequent (question_clusters.py)
+sur des logs synthétiques : durée par taille, et écart avec la double boucle d'origine sur les
+petites tailles (le regroupement par index est approché : part des questions rangées dans le même
+groupe, et effectifs des 10 premiers groupes).
+
+Usage :
+    python bench_clusters.py [--sizes 10000,20000,50000,100000] [--check-max 3000] [--output resultats.json]
+"""
+import argparse
+import json
+import random
+import time
+from difflib import SequenceMatcher
+
+from bench_load import synthetic_question
+from question_clusters import group_similar_questions
+
+SUFFIXES = ["", "", " merci", " svp", " rapidement", " pour demain", " pour notre association", " en couleur"]
+
+
+def noisy_question(rng):
+    """Question des logs synthétiques, avec fautes de frappe et précisions pour varier les textes"""
+    question = synthetic_question(rng) + rng.choice(SUFFIXES)
+    if rng.random() < 0.3:
+        question += f" (réf. {rng.randint(1, 5000)})"
+    for _ in range(rng.choice([0, 0, 1, 2])):
+        position = rng.randrange(len(question))
+        question = question[:position] + question[position + 1:]
+    return question
+
+
+def pairwise_groups(questions, min_similarity=0.7, top=10):
+    """Double boucle d'origine de /questions_frequent (référence, O(n²))"""
+    question_groups = []
+    used = set()
+    for i, q1 in enumerate(questions):
+        if i in used:
+            continue
+        similar = []
+        for j, q2 in enumerate(questions):
+            if i != j and j not in used:
+                ratio = SequenceMatcher(None, q1.lower(), q2.lower()).ratio()
+                if ratio > min_similarity:
+                    similar.append(q2)
+                    used.add(j)
+        used.add(i)
+        question_groups.append({"question": q1, "count": 1 + len(similar), "similar": similar})
+    return sorted(question_groups, key=lambda x: x["count"], reverse=True)[:top]
+
+
+def agreement(expected, grouped, questions):
+    """Part des questions rangées dans le groupe de la même question de tête"""
+    def leaders(groups):
+        leader = {}
+        for group in groups:
+            for question in [group["question"]] + group["similar"]:
+                leader.setdefault(question, group["question"])
+        return leader
+    expected_leader, grouped_leader = leaders(expected), leaders(grouped)
+    return sum(expected_leader.get(q) == grouped_leader.get(q) for q in questions) / len(questions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,20000,50000,100000", help="Nombres de questions mesurés")
+    parser.add_argument("--check-max", type=int, default=3000, help="Taille maximale comparée à la double boucle")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Fichier JSON des résultats")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    questions = [noisy_question(rng) for _ in range(max(sizes + [args.check_max]))]
+
+    results = {}
+    if args.check_max:
+        sample = questions[:args.check_max]
+        start = time.perf_counter()
+        expected = pairwise_groups(sample, top=len(sample))
+        pairwise_s = time.perf_counter() - start
+        start = time.perf_counter()
+        grouped = group_similar_questions(sample, top=len(sample))
+        indexed_s = time.perf_counter() - start
+        same_share = agreement(expected, grouped, sample)
+        same_top = [g["count"] for g in grouped[:10]] == [g["count"] for g in expected[:10]]
+        results["check"] = {
+            "size": len(sample), "pairwise_s": pairwise_s, "indexed_s": indexed_s,
+            "same_group_share": same_share, "same_top_counts": same_top, "identical": grouped == expected
+        }
+        print(f"{len(sample):>7} questions : double boucle {pairwise_s:.2f} s, index {indexed_s:.2f} s, "
+              f"{same_share:.1%} des questions dans le même groupe, "
+              f"10 premiers groupes {'de même effectif' if same_top else 'DIFFÉRENTS'}")
+
+    for size in sizes:
+        start = time.perf_counter()
+        groups = group_similar_questions(questions[:size])
+        elapsed = time.perf_counter() - start
+        results[str(size)] = {"seconds": elapsed, "largest_group": groups[0]["count"] if groups else 0}
+        print(f"{size:>7} questions : {elapsed:.2f} s ({elapsed / size * 1e6:.0f} µs/question)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
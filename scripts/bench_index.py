@@ -0,0 +1,124 @@
+"""
+Compare la taille et la latence de l'index vectoriel selon la dimension et le type de stockage.
+
+Usage :
+    python bench_index.py <client_id> [--dimensions 3072,1024,512] [--dtypes float32,float16,int8,int8+rescore]
+    python bench_index.py --synthetic 5000 --source-dimensions 3072
+
+Les vecteurs sont lus dans l'index numpy du client (vector_index) ou, à défaut, dans sa
+collection Chroma. Les dimensions réduites sont simulées par troncature puis normalisation,
+ce qui correspond au paramètre "dimensions" des modèles text-embedding-3.
+La précision est mesurée par le recall@k par rapport à la recherche float32 en pleine dimension.
+"int8+rescore" : codes int8 et copie float16 pour re-scorer les candidats (vector_rescore).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from collection_registry import directory_size
+from vector_index import VectorIndex, normalize_rows, write_vector_index
+
+CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
+
+
+def load_client_vectors(client_id):
+    vector_dir = CLIENTS_PATH / client_id / "vector_index"
+    if vector_dir.exists():
+        return VectorIndex(vector_dir).rows()
+    import chromadb
+    client = chromadb.PersistentClient(path=str(CLIENTS_PATH / client_id / "chroma_db"))
+    collection = client.get_collection("wordpress_content")
+    return np.asarray(collection.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+
+
+def measure(index, queries, top_k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([position for position, _ in index.search(query, top_k)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+    }, results
+
+
+def recall(results, reference):
+    hits = sum(len(set(r) & set(ref)) for r, ref in zip(results, reference))
+    total = sum(len(ref) for ref in reference)
+    return round(hits / total, 4) if total else 1.0
+
+
+def run(vectors, dimensions_list, dtypes, queries_count, top_k):
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(vectors), size=min(queries_count, len(vectors)), replace=False)
+    # Requêtes proches des documents existants (document + bruit)
+    full_queries = vectors[picks] + rng.normal(0, 0.01, size=(len(picks), vectors.shape[1])).astype(np.float32)
+
+    rows, reference = [], None
+    with tempfile.TemporaryDirectory() as tmp:
+        for dimensions in dimensions_list:
+            truncated = normalize_rows(vectors[:, :dimensions])
+            queries = full_queries[:, :dimensions]
+            for variant in dtypes:
+                dtype, _, option = variant.partition("+")
+                index_dir = Path(tmp) / f"{dimensions}_{variant}"
+                n = len(truncated)
+                write_vector_index(index_dir, [str(i) for i in range(n)], [""] * n, [{}] * n, truncated, "bench", dtype,
+                                   rescore=option == "rescore")
+                latency, results = measure(VectorIndex(index_dir), queries, top_k)
+                if reference is None:
+                    reference = results
+                rows.append({
+                    "dimensions": dimensions,
+                    "dtype": variant,
+                    "size_mb": round(directory_size(index_dir) / 1024 / 1024, 2),
+                    **latency,
+                    f"recall@{top_k}": recall(results, reference),
+                })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("client_id", nargs="?")
+    parser.add_argument("--synthetic", type=int, help="Nombre de vecteurs aléatoires à générer")
+    parser.add_argument("--source-dimensions", type=int, default=3072)
+    parser.add_argument("--dimensions", default="3072,1536,1024,512")
+    parser.add_argument("--dtypes", default="float32,float16,int8,int8+rescore")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Sortie JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = np.random.default_rng(1).normal(size=(args.synthetic, args.source_dimensions)).astype(np.float32)
+    elif args.client_id:
+        vectors = load_client_vectors(args.client_id)
+    else:
+        parser.print_usage()
+        sys.exit(1)
+
+    # La première configuration doit être la référence : pleine dimension en float32
+    dimensions_list = sorted({int(d) for d in args.dimensions.split(",") if int(d) <= vectors.shape[1]} | {vectors.shape[1]}, reverse=True)
+    dtypes = ["float32"] + [d for d in args.dtypes.split(",") if d != "float32"]
+    rows = run(vectors, dimensions_list, dtypes, args.queries, args.top_k)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{len(vectors)} vecteurs, dimension source {vectors.shape[1]}")
+    print(f"{'dimensions':>10} {'dtype':>12} {'taille Mo':>10} {'p50 ms':>8} {'p95 ms':>8} {'recall':>8}")
+    for row in rows:
+        print(f"{row['dimensions']:>10} {row['dtype']:>12} {row['size_mb']:>10} {row['p50_ms']:>8} {row['p95_ms']:>8} {row[f'recall@{args.top_k}']:>8}")
+
+
+if __name__ == "__main__":
+    main()
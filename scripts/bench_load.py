@@ -0,0 +1,347 @@
+"""
+Test de charge de bout en bout du backend Flask.
+
+Génère une arborescence data/clients synthétique (contenu, index, plusieurs mois de
+questions_logs), démarre backend.app sur un port local avec le fournisseur de modèles
+"local" (aucun appel à l'API OpenAI), puis envoie des requêtes concurrentes sur chaque
+endpoint et mesure le débit et les latences p50/p95/p99.
+
+Usage :
+    python bench_load.py [--clients 5] [--months 6] [--questions-per-month 300]
+                         [--concurrency 16] [--requests 300] [--output resultats.json]
+    python bench_load.py --baseline avant.json --output apres.json
+    python bench_load.py --compare avant.json apres.json [--tolerance 0.10]
+
+Avec --baseline ou --compare, le code de sortie vaut 1 si un endpoint régresse
+(p95/p99 plus lents ou débit plus faible au-delà de la tolérance).
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ENDPOINTS = ["ask", "questions_stats", "questions_frequent", "questions_log"]
+
+TOPICS = [
+    "flyers", "affiches", "cartes de visite", "bâches", "kakemonos", "stickers", "brochures",
+    "enseignes", "roll-up", "tampons", "calendriers", "faire-part", "catalogues", "étiquettes",
+]
+QUESTION_TEMPLATES = [
+    "Combien coûtent les {} ?",
+    "Quel est le prix des {} ?",
+    "Comment commander des {} ?",
+    "Quel délai pour des {} ?",
+    "Livrez-vous les {} à domicile ?",
+    "Puis-je avoir un devis pour des {} ?",
+    "Quels formats proposez-vous pour les {} ?",
+    "Faites-vous des {} personnalisés ?",
+]
+CONTENT_TEMPLATES = [
+    "Nous imprimons vos {} en petite et grande série, sur papier recyclé ou couché.",
+    "Le délai de fabrication des {} est de 48 heures après validation du BAT.",
+    "Les {} sont livrés gratuitement à partir de 50 euros de commande.",
+    "Demandez un devis pour vos {} : notre équipe vous répond sous 24 heures.",
+    "Formats disponibles pour les {} : A6, A5, A4, A3 et formats sur mesure.",
+]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+# ---------------------------------------------------------------------------
+# Génération des données
+# ---------------------------------------------------------------------------
+
+def synthetic_question(rng):
+    question = rng.choice(QUESTION_TEMPLATES).format(rng.choice(TOPICS))
+    # Quelques variantes de saisie, comme dans les vrais logs
+    if rng.random() < 0.2:
+        question = question.lower()
+    if rng.random() < 0.1:
+        question = "Bonjour, " + question[0].lower() + question[1:]
+    return question
+
+
+def month_starts(months, now):
+    year, month = now.year, now.month
+    starts = []
+    for _ in range(months):
+        starts.append(datetime(year, month, 1))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return starts
+
+
+def write_question_logs(client_dir, client_id, months, per_month, rng, now, log_format="jsonl"):
+    periods = []
+    for start in month_starts(months, now):
+        end = now if (start.year, start.month) == (now.year, now.month) else (
+            datetime(start.year + (start.month == 12), start.month % 12 + 1, 1)
+        )
+        span = max(1, int((end - start).total_seconds()))
+        stamps = sorted(start + timedelta(seconds=rng.randrange(span)) for _ in range(per_month))
+        logs = [{
+            "timestamp": stamp.isoformat(),
+            "question": synthetic_question(rng),
+            "answer": "Réponse de test.",
+            "user_ip": f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+            "client_id": client_id,
+        } for stamp in stamps]
+        year, month = start.strftime("%Y"), start.strftime("%m")
+        logs_dir = client_dir / "questions_logs" / year / month
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        if log_format == "json":
+            # Ancien format (tableau JSON réécrit à chaque question)
+            with open(logs_dir / f"{year}-{month}.json", "w", encoding="utf-8") as f:
+                json.dump(logs, f, ensure_ascii=False, indent=2)
+        else:
+            with open(logs_dir / f"{year}-{month}.jsonl", "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(log, ensure_ascii=False) + "\n" for log in logs)
+        periods.append(f"{year}-{month}")
+    return periods
+
+
+def generate_tree(clients_path, args):
+    """Crée les clients synthétiques et construit leurs index avec le fournisseur local"""
+    import index_embeddings
+
+    rng = random.Random(args.seed)
+    now = datetime.now()
+    tenants = {}
+    for n in range(args.clients):
+        client_id = f"bench-{n:03d}"
+        client_dir = clients_path / client_id
+        client_dir.mkdir(parents=True, exist_ok=True)
+        config = {
+            "client_id": client_id,
+            "provider": "local",
+            "retrieval_engine": args.engine,
+        }
+        # Sans dimension réduite, la clé est omise (null serait signalé comme invalide au chargement)
+        if args.embedding_dimensions:
+            config["embedding_dimensions"] = args.embedding_dimensions
+        with open(client_dir / "config.json", "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        pages = []
+        for i in range(args.pages):
+            topic = rng.choice(TOPICS)
+            paragraphs = [rng.choice(CONTENT_TEMPLATES).format(topic) for _ in range(rng.randint(3, 8))]
+            pages.append({
+                "title": f"{topic.capitalize()} - page {i}",
+                "url": f"https://{client_id}.example/{i}",
+                "type": "page",
+                "content": "\n".join(paragraphs),
+                "modified": now.isoformat(),
+            })
+        with open(client_dir / "content.json", "w", encoding="utf-8") as f:
+            json.dump(pages, f, ensure_ascii=False, indent=2)
+        (client_dir / "should_index.txt").write_text("bench", encoding="utf-8")
+        index_embeddings.build_chroma_collection(client_id)
+        tenants[client_id] = write_question_logs(
+            client_dir, client_id, args.months, args.questions_per_month, rng, now, args.log_format
+        )
+    return tenants
+
+
+# ---------------------------------------------------------------------------
+# Charge
+# ---------------------------------------------------------------------------
+
+def build_request(endpoint, tenants, rng):
+    client_id = rng.choice(sorted(tenants))
+    period = rng.choice(tenants[client_id])
+    if endpoint == "ask":
+        return "POST", "/ask", {"json": {"question": synthetic_question(rng), "client_id": client_id}}
+    if endpoint == "questions_stats":
+        return "GET", "/questions_stats", {"params": {"client_id": client_id}}
+    if endpoint == "questions_frequent":
+        return "GET", "/questions_frequent", {"params": {"client_id": client_id, "period": period}}
+    if endpoint == "questions_log":
+        return "GET", "/questions_log", {"params": {"client_id": client_id, "period": period, "limit": 50}}
+    raise ValueError(f"Endpoint inconnu : {endpoint}")
+
+
+def run_endpoint(base_url, api_key, endpoint, tenants, args):
+    import requests
+
+    rng = random.Random(f"{args.seed}-{endpoint}")
+    plan = [build_request(endpoint, tenants, rng) for _ in range(args.warmup + args.requests)]
+    local = threading.local()
+
+    def send(request):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.headers["X-API-Key"] = api_key
+        method, path, kwargs = request
+        start = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, timeout=60, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(send, plan[:args.warmup]))
+        start = time.perf_counter()
+        results = list(pool.map(send, plan[args.warmup:]))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, ok in results if not ok),
+        "rps": round(len(results) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+
+    # Pas de ligne de log par requête pendant la mesure
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+# ---------------------------------------------------------------------------
+# Rapport et comparaison
+# ---------------------------------------------------------------------------
+
+def print_results(results):
+    print(f"{'endpoint':<20} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erreurs':>8}")
+    for endpoint, row in results["endpoints"].items():
+        print(f"{endpoint:<20} {row['rps']:>9} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {row['errors']:>8}")
+
+
+def compare(baseline, current, tolerance):
+    """Affiche l'écart entre deux résultats et retourne la liste des régressions"""
+    regressions = []
+    print(f"{'endpoint':<20} {'mesure':>7} {'avant':>10} {'après':>10} {'écart':>8}")
+    for endpoint, row in current["endpoints"].items():
+        before = baseline["endpoints"].get(endpoint)
+        if before is None:
+            continue
+        for metric, higher_is_better in (("rps", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False)):
+            old, new = before.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            delta = (new - old) / old
+            flag = ""
+            # Seuls p95, p99 et le débit font échouer la comparaison (p50 est indicatif)
+            if metric != "p50_ms" and (delta < -tolerance if higher_is_better else delta > tolerance):
+                regressions.append(f"{endpoint} {metric}")
+                flag = " ⚠"
+            print(f"{endpoint:<20} {metric.replace('_ms', ''):>7} {old:>10} {new:>10} {delta:>+8.1%}{flag}")
+    return regressions
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=5, help="Nombre de clients générés")
+    parser.add_argument("--pages", type=int, default=40, help="Pages de contenu par client")
+    parser.add_argument("--months", type=int, default=6, help="Mois de questions_logs par client")
+    parser.add_argument("--questions-per-month", type=int, default=300)
+    parser.add_argument("--log-format", choices=["jsonl", "json"], default="jsonl", help="Format des questions_logs générés")
+    parser.add_argument("--embedding-dimensions", type=int, default=256, help="0 : dimension complète du modèle")
+    parser.add_argument("--engine", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=300, help="Requêtes mesurées par endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="Requêtes de chauffe (non mesurées)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", help="Dossier de génération (temporaire et supprimé par défaut)")
+    parser.add_argument("--output", help="Fichier JSON des résultats")
+    parser.add_argument("--baseline", help="Résultats de référence à comparer après le test")
+    parser.add_argument("--compare", nargs=2, metavar=("AVANT", "APRES"), help="Compare deux fichiers de résultats")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Écart relatif toléré avant régression")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(load_results(args.compare[0]), load_results(args.compare[1]), args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+    endpoints = [e for e in args.endpoints.split(",") if e]
+    for endpoint in endpoints:
+        if endpoint not in ENDPOINTS:
+            parser.error(f"endpoint inconnu : {endpoint} (disponibles : {', '.join(ENDPOINTS)})")
+
+    data_dir = Path(args.data_dir) if args.data_dir else Path(tempfile.mkdtemp(prefix="chatbot-bench-"))
+    clients_path = data_dir / "clients"
+    # Configuration lue à l'import des modules du backend : à définir avant de les importer
+    os.environ["CHATBOT_CLIENTS_PATH"] = str(clients_path)
+    os.environ["CHATBOT_EMBEDDING_CACHE_PATH"] = str(data_dir / "cache" / "embeddings.sqlite3")
+    os.environ["CHATBOT_PROVIDER"] = "local"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+    try:
+        start = time.perf_counter()
+        tenants = generate_tree(clients_path, args)
+        print(f"{args.clients} clients générés dans {clients_path} ({time.perf_counter() - start:.1f} s)")
+
+        import backend
+        server, base_url = serve(backend.app)
+        results = {
+            "meta": {
+                "date": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "clients": args.clients,
+                "pages": args.pages,
+                "months": args.months,
+                "questions_per_month": args.questions_per_month,
+                "log_format": args.log_format,
+                "engine": args.engine,
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "seed": args.seed,
+            },
+            "endpoints": {},
+        }
+        try:
+            for endpoint in endpoints:
+                results["endpoints"][endpoint] = run_endpoint(base_url, backend.API_KEY, endpoint, tenants, args)
+        finally:
+            server.shutdown()
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Résultats écrits dans {args.output}")
+    if args.baseline:
+        print()
+        regressions = compare(load_results(args.baseline), results, args.tolerance)
+        if regressions:
+            print(f"Régressions : {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import asyncio
+import os
+
+from chatbot_requete import (
+    get_client_settings, new_request_state, lookup_cached_answer,
+    lexical_fast_path, retrieve_contexts, remember_answer, embedding_options,
+    SINGLE_FLIGHT_ENABLED, inflight_key, fallback_answer,
+)
+from metrics import timed
+from singleflight import AsyncSingleFlight
+from upstream import UpstreamError, call_chat_async, call_embedding_async
+from embedding_cache import CACHE_ENABLED, embedding_cache
+
+# Limites d'appels simultanés vers l'API OpenAI :
+# - CHATBOT_MAX_UPSTREAM_CONCURRENCY : pour tout le processus
+# - CHATBOT_MAX_CLIENT_CONCURRENCY : par client (surchargeable par "max_concurrency" dans config.json)
+MAX_UPSTREAM_CONCURRENCY = int(os.environ.get("CHATBOT_MAX_UPSTREAM_CONCURRENCY", "100"))
+MAX_CLIENT_CONCURRENCY = int(os.environ.get("CHATBOT_MAX_CLIENT_CONCURRENCY", "20"))
+
+inflight_questions = AsyncSingleFlight()
+
+_global_limit = None
+_client_limits = {}
+
+
+class upstream_slot:
+    """Réserve une place parmi les appels simultanés autorisés (global et par client)"""
+
+    def __init__(self, settings):
+        global _global_limit
+        if _global_limit is None:
+            _global_limit = asyncio.Semaphore(MAX_UPSTREAM_CONCURRENCY)
+        client_id = settings["client_id"]
+        limit = settings["max_concurrency"] or MAX_CLIENT_CONCURRENCY
+        semaphore = _client_limits.get(client_id)
+        if semaphore is None or semaphore.limit != limit:
+            semaphore = asyncio.Semaphore(limit)
+            semaphore.limit = limit
+            _client_limits[client_id] = semaphore
+        self._semaphores = (semaphore, _global_limit)
+
+    async def __aenter__(self):
+        # Toujours acquérir le sémaphore client avant le global, pour ne pas bloquer
+        # les autres clients pendant l'attente d'un client saturé
+        await self._semaphores[0].acquire()
+        try:
+            await self._semaphores[1].acquire()
+        except BaseException:
+            self._semaphores[0].release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self._semaphores[1].release()
+        self._semaphores[0].release()
+
+
+async def get_embedding_async(text, settings, deadline=None):
+    # Le cache d'embeddings (SQLite) et la config du client lisent le disque : dans un thread,
+    # pour ne pas bloquer la boucle d'événements
+    loop = asyncio.get_running_loop()
+    provider = settings["provider"]
+    options, cache_key = embedding_options(settings["embedding_model"], settings["embedding_dimensions"], provider)
+    if CACHE_ENABLED:
+        cached = await loop.run_in_executor(None, embedding_cache.get, text, cache_key)
+        if cached is not None:
+            return cached
+    async with upstream_slot(settings):
+        embeddings = await call_embedding_async(
+            settings["embedding_model"],
+            lambda timeout: provider.embed_async([text], settings["embedding_model"], timeout=timeout, **options),
+            deadline
+        )
+    embedding = embeddings[0]
+    if CACHE_ENABLED:
+        await loop.run_in_executor(None, embedding_cache.put, text, cache_key, embedding)
+    return embedding
+
+
+async def ask_gpt_async(prompt, settings, deadline=None):
+    messages = [
+        {"role": "system", "content": settings["system_prompt"]},
+        {"role": "user", "content": prompt}
+    ]
+    async with upstream_slot(settings):
+        answer = await call_chat_async(settings["openai_model"], lambda timeout: settings["provider"].complete_async(
+            messages, settings["openai_model"], settings["temperature"], settings["max_tokens"], timeout=timeout
+        ), deadline)
+    return answer.strip()
+
+
+async def chatbot_response_async(user_question, client_id="default"):
+    """Équivalent asynchrone de chatbot_response : la requête Chroma tourne dans un thread"""
+    return (await chatbot_answer_async(user_question, client_id))[0]
+
+
+async def chatbot_answer_async(user_question, client_id="default"):
+    """Équivalent asynchrone de chatbot_answer : (réponse, embedding de la question ou None)"""
+    if SINGLE_FLIGHT_ENABLED:
+        return await inflight_questions.do(
+            inflight_key(user_question, client_id),
+            lambda: compute_response_async(user_question, client_id)
+        )
+    return await compute_response_async(user_question, client_id)
+
+
+async def compute_response_async(user_question, client_id="default"):
+    loop = asyncio.get_running_loop()
+    with timed("config", client_id):
+        settings = await loop.run_in_executor(None, get_client_settings, client_id)
+    state = new_request_state(user_question, settings)
+    try:
+        if not await loop.run_in_executor(None, lexical_fast_path, state):
+            with timed("embedding", client_id):
+                state["query_embedding"] = await get_embedding_async(user_question, settings, state["deadline"])
+            if await loop.run_in_executor(None, lookup_cached_answer, state) is not None:
+                return state["cached_answer"], state["query_embedding"]
+            await loop.run_in_executor(None, retrieve_contexts, state)
+        with timed("completion", client_id):
+            answer = await ask_gpt_async(state["prompt"], settings, state["deadline"])
+    except UpstreamError as e:
+        print(f"API indisponible pour {client_id} : {e}")
+        return fallback_answer(client_id), None
+    await loop.run_in_executor(None, remember_answer, state, answer)
+    return answer, state["query_embedding"]
@@ -1,13 +1,31 @@
 import os
-import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import openai
 import chromadb
 from pathlib import Path
+from collection_registry import path_signature, registry
+from embedding_cache import CACHE_ENABLED, embedding_cache, normalize_question
+from answer_cache import answer_cache, answer_cache_settings, paths_version
+from client_config import load_client_config, config_version
+from singleflight import SingleFlight
+from metrics import client_label, fallback_answers, stage_seconds, timed
+from providers import get_provider
+from upstream import Deadline, UpstreamError, FALLBACK_ANSWER, call_chat, call_chat_stream, call_embedding
+from prompt_budget import assemble_contexts
+from vector_index import VectorIndex
+from lexical_index import (
+    LEXICAL_INDEX_FILE, LexicalIndex, hybrid_settings, is_decisive, reciprocal_rank_fusion,
+)
 
 # Chargement de la clé API OpenAI
 load_dotenv(dotenv_path=Path(__file__).resolve().parent / ".env", override=True)
 openai.api_key = os.getenv("OPENAI_API_KEY")
+# Pas de nouvel essai automatique du SDK : délais, hedging et disjoncteurs sont gérés par upstream.py
+openai.max_retries = 0
 
 # Configuration par défaut
 AI_CONFIG = {
@@ -17,47 +35,208 @@ AI_CONFIG = {
     "top_k_results": 5,
     "temperature": 0.4,
     "max_tokens": 300,
-    "collection_name": "wordpress_content"
+    "collection_name": "wordpress_content",
+    "context_token_budget": 1500
 }
 
+# Nombre maximal de complétions simultanées pour /ask/batch
+BATCH_CONCURRENCY = int(os.environ.get("CHATBOT_BATCH_CONCURRENCY", "8"))
+
+# Regroupement des questions identiques posées simultanément ("0" pour désactiver)
+SINGLE_FLIGHT_ENABLED = os.environ.get("CHATBOT_SINGLE_FLIGHT", "1") != "0"
+inflight_questions = SingleFlight()
+
 # Chemin des clients, défini par la variable d'environnement CHATBOT_CLIENTS_PATH
 CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
 
-def load_client_config(client_id):
-    config_path = CLIENTS_PATH / client_id / "config.json"
-    if config_path.is_file():
-        with open(config_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def get_embedding(text, model):
-    response = openai.embeddings.create(input=text, model=model)
-    return response.data[0].embedding
-
-def search_chroma(query, chroma_dir, collection_name, embedding_model, top_k):
-    client = chromadb.PersistentClient(path=chroma_dir)
-    collection = client.get_collection(collection_name)
-    query_embedding = get_embedding(query, embedding_model)
-
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k ,  
-        include=["documents", "metadatas"]
+def embedding_options(model, dimensions=None, provider=None):
+    """Options de l'appel embeddings et clé de cache associée (fournisseur, modèle et dimension)"""
+    options = {"dimensions": dimensions} if dimensions else {}
+    cache_key = f"{model}@{dimensions}" if dimensions else model
+    if provider is not None and provider.name != "openai":
+        cache_key = f"{provider.name}:{cache_key}"
+    return options, cache_key
+
+def get_embeddings(texts, model, dimensions=None, deadline=None, provider=None):
+    """Embeddings de plusieurs textes : cache d'abord, puis un seul appel à l'API pour le reste"""
+    provider = provider or get_provider()
+    options, cache_key = embedding_options(model, dimensions, provider)
+    embeddings = [None] * len(texts)
+    missing = []
+    for i, text in enumerate(texts):
+        if CACHE_ENABLED:
+            embeddings[i] = embedding_cache.get(text, cache_key)
+        if embeddings[i] is None:
+            missing.append(i)
+    if missing:
+        vectors = call_embedding(
+            model,
+            lambda timeout: provider.embed([texts[i] for i in missing], model, timeout=timeout, **options),
+            deadline
+        )
+        for i, embedding in zip(missing, vectors):
+            embeddings[i] = embedding
+            if CACHE_ENABLED:
+                embedding_cache.put(texts[i], cache_key, embedding)
+    return embeddings
+
+def get_embedding(text, model, dimensions=None, deadline=None, provider=None):
+    provider = provider or get_provider()
+    options, cache_key = embedding_options(model, dimensions, provider)
+    # Les visiteurs reposent souvent les mêmes questions : on évite l'appel à l'API
+    if CACHE_ENABLED:
+        cached = embedding_cache.get(text, cache_key)
+        if cached is not None:
+            return cached
+    embedding = call_embedding(
+        model,
+        lambda timeout: provider.embed([text], model, timeout=timeout, **options)[0],
+        deadline
+    )
+    if CACHE_ENABLED:
+        embedding_cache.put(text, cache_key, embedding)
+    return embedding
+
+# Systèmes Chroma ouverts par ce processus : chromadb les partage par chemin (SharedSystemClient).
+# Après une réindexation (chroma_db remplacé par renommage), le système en cache lit encore l'ancien
+# dossier : il est détaché du cache avant l'ouverture du nouveau, et arrêté à la fermeture de sa
+# dernière collection, sans toucher au système de la nouvelle génération.
+_chroma_lock = threading.Lock()
+_chroma_generations = {}  # chemin -> signature du dossier lu par le système en cache
+_chroma_handles = {}  # id(système) -> nombre de collections ouvertes dessus
+
+def _chroma_system(identifier, detach=False, expected=None):
+    """
+    Seul accès au cache privé de chromadb (SharedSystemClient) : système partagé du chemin,
+    retiré du cache si `detach` (seulement s'il s'agit de `expected`, si donné) ; None si absent
+    ou si la version de chromadb n'a pas ce cache.
+    """
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:
+        return None
+    # Attributs privés de chromadb 1.5.9 (version fixée dans requirements.txt) : sans eux, les
+    # systèmes ne sont ni détachés ni arrêtés, et un index reconstruit n'est relu qu'au redémarrage
+    systems = getattr(SharedSystemClient, "_identifier_to_system", {})
+    system = systems.get(identifier)
+    if system is None or (expected is not None and system is not expected):
+        return None
+    if detach:
+        systems.pop(identifier, None)
+        getattr(SharedSystemClient, "_identifier_to_refcount", {}).pop(identifier, None)
+    return system
+
+def open_chroma_collection(chroma_dir, collection_name):
+    path = str(chroma_dir)
+    with _chroma_lock:
+        signature = path_signature(path)
+        if _chroma_generations.get(path) != signature:
+            # Nouvelle génération de l'index : un PersistentClient réutiliserait l'ancien système
+            _chroma_system(path, detach=True)
+            _chroma_generations[path] = signature
+        client = chromadb.PersistentClient(path=path)
+        system = _chroma_system(path)
+        if system is not None:
+            _chroma_handles[id(system)] = _chroma_handles.get(id(system), 0) + 1
+    return client, client.get_collection(collection_name), system
+
+def close_chroma_collection(handle):
+    client, _, system = handle
+    if system is None:
+        if hasattr(client, "close"):
+            client.close()
+        return
+    with _chroma_lock:
+        remaining = _chroma_handles.get(id(system), 1) - 1
+        if remaining > 0:
+            _chroma_handles[id(system)] = remaining
+            return
+        _chroma_handles.pop(id(system), None)
+        # Toujours en cache s'il n'a pas été remplacé par une nouvelle génération
+        _chroma_system(str(getattr(system.settings, "persist_directory", "")), detach=True, expected=system)
+    system.stop()
+
+def search_chroma(query, chroma_dir, collection_name, embedding_model, top_k, query_embedding=None, dimensions=None):
+    if query_embedding is None:
+        query_embedding = get_embedding(query, embedding_model, dimensions)
+    return search_chroma_many(chroma_dir, collection_name, [query_embedding], top_k)[0]
+
+def acquire_chroma_collection(chroma_dir, collection_name):
+    return registry.acquire(
+        ("chroma", str(chroma_dir), collection_name),
+        chroma_dir,
+        opener=lambda path: open_chroma_collection(path, collection_name),
+        closer=close_chroma_collection,
     )
-    # Associer chaque chunk à sa metadata
-    docs = results["documents"][0] if results["documents"] else []
-    metas = results["metadatas"][0] if results["metadatas"] else []
-    # Fusionner et trier par date de modification (décroissante)
-    passages = []
-    for doc, meta in zip(docs, metas):
-        passages.append({
-            "content": doc,
-            "modified": meta.get("modified", "1970-01-01"),
-            "title": meta.get("title", ""),
-            "url": meta.get("url", "")
-        })
-    
-    return passages[:top_k]
+
+def acquire_vector_index(vector_dir):
+    return registry.acquire(("numpy", str(vector_dir)), vector_dir, opener=VectorIndex)
+
+def acquire_lexical_index(index_path):
+    return registry.acquire(("lexical", str(index_path)), index_path, opener=LexicalIndex)
+
+def search_chroma_many(chroma_dir, collection_name, query_embeddings, top_k):
+    """Une seule requête Chroma pour plusieurs embeddings ; une liste de passages par embedding"""
+    with acquire_chroma_collection(chroma_dir, collection_name) as (_, collection, _):
+        results = collection.query(
+            query_embeddings=query_embeddings,
+            n_results=top_k ,  
+            include=["documents", "metadatas"]
+        )
+    all_passages = []
+    for n in range(len(query_embeddings)):
+        # Associer chaque chunk à sa metadata
+        docs = results["documents"][n] if results["documents"] else []
+        metas = results["metadatas"][n] if results["metadatas"] else []
+        ids = results["ids"][n] if results.get("ids") else [None] * len(docs)
+        passages = []
+        for doc, meta, doc_id in zip(docs, metas, ids):
+            passages.append({
+                "id": doc_id,
+                "content": doc,
+                "modified": meta.get("modified", "1970-01-01"),
+                "title": meta.get("title", ""),
+                "url": meta.get("url", "")
+            })
+        all_passages.append(passages[:top_k])
+    return all_passages
+
+def search_vector_index(query, vector_dir, embedding_model, top_k, query_embedding=None, dimensions=None):
+    """Moteur "numpy" : recherche sur l'index écrit par index_embeddings.py"""
+    if query_embedding is None:
+        query_embedding = get_embedding(query, embedding_model, dimensions)
+    return search_vector_index_many(vector_dir, [query_embedding], top_k)[0]
+
+def search_vector_index_many(vector_dir, query_embeddings, top_k):
+    with acquire_vector_index(vector_dir) as index:
+        return [
+            [index.passage(position) for position, _ in index.search(query_embedding, top_k)]
+            for query_embedding in query_embeddings
+        ]
+
+def search_lexical(query, index_path, top_k):
+    """Recherche BM25 sur l'index inversé écrit par index_embeddings.py"""
+    with acquire_lexical_index(index_path) as index:
+        return [index.passage(position) | {"score": score} for position, score in index.search(query, top_k)]
+
+def warm_indexes(settings, chroma=True):
+    """
+    Ouvre les index du client dans le registre et force leur chargement en mémoire
+    (index HNSW de Chroma, pages du memmap numpy) par une recherche sur un de leurs vecteurs.
+    chroma=False : uniquement les index en lecture seule, partageables avant un fork.
+    """
+    if settings["retrieval_engine"] == "numpy":
+        with acquire_vector_index(settings["vector_dir"]) as index:
+            if len(index):
+                index.search(index.rows(0, 1)[0], 1)
+    elif chroma:
+        with acquire_chroma_collection(settings["chroma_dir"], settings["collection_name"]) as (_, collection, _):
+            sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+            if sample is not None and len(sample):
+                collection.query(query_embeddings=[sample[0]], n_results=1, include=[])
+    if settings["hybrid"] and os.path.exists(settings["lexical_index_path"]):
+        with acquire_lexical_index(settings["lexical_index_path"]):
+            pass
 
 def build_prompt(user_query, contexts, system_prompt):
     prompt = "Voici des extraits du site :\n"
@@ -71,34 +250,362 @@ def build_prompt(user_query, contexts, system_prompt):
     )
     return prompt
 
-def ask_gpt(prompt, system_prompt, model, temperature, max_tokens):
-    response = openai.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=temperature,
-        max_tokens=max_tokens
+def ask_gpt(prompt, system_prompt, model, temperature, max_tokens, deadline=None, provider=None):
+    provider = provider or get_provider()
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+    answer = call_chat(
+        model,
+        lambda timeout: provider.complete(messages, model, temperature, max_tokens, timeout=timeout),
+        deadline
     )
-    return response.choices[0].message.content.strip()
+    return answer.strip()
 
-def chatbot_response(user_question, client_id="default"):
+def ask_gpt_stream(prompt, system_prompt, model, temperature, max_tokens, deadline=None, provider=None):
+    """
+    Comme ask_gpt, mais renvoie un itérateur sur les morceaux de réponse au fil de leur génération.
+    L'appel est lancé immédiatement : une API indisponible lève UpstreamError ici, une coupure
+    du flux en cours de génération lève UpstreamError pendant l'itération.
+    """
+    provider = provider or get_provider()
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+    return call_chat_stream(
+        model,
+        lambda timeout: provider.stream(messages, model, temperature, max_tokens, timeout=timeout),
+        deadline
+    )
+
+def get_client_settings(client_id):
     client_conf = load_client_config(client_id)
 
     # Paramètres avec fallback sur config globale
-    system_prompt = client_conf.get("system_prompt", AI_CONFIG["system_prompt"])
-    top_k = client_conf.get("top_k_results", AI_CONFIG["top_k_results"])
-    temperature = client_conf.get("temperature", AI_CONFIG["temperature"])
-    max_tokens = client_conf.get("max_tokens", AI_CONFIG["max_tokens"])
-    openai_model = client_conf.get("openai_model", AI_CONFIG["openai_model"])
-    embedding_model = client_conf.get("embedding_model", AI_CONFIG["embedding_model"])
     chroma_dir = client_conf.get("chroma_dir", str(CLIENTS_PATH / client_id / "chroma_db"))
-    collection_name = client_conf.get("collection_name", AI_CONFIG["collection_name"])
+    vector_dir = client_conf.get("vector_index_dir", str(CLIENTS_PATH / client_id / "vector_index"))
+    # Moteur de recherche : "chroma" (par défaut) ou "numpy"
+    retrieval_engine = client_conf.get("retrieval_engine", "chroma")
+    index_dir = vector_dir if retrieval_engine == "numpy" else chroma_dir
+    return {
+        "client_id": client_id,
+        "system_prompt": client_conf.get("system_prompt", AI_CONFIG["system_prompt"]),
+        "top_k": client_conf.get("top_k_results", AI_CONFIG["top_k_results"]),
+        "temperature": client_conf.get("temperature", AI_CONFIG["temperature"]),
+        "max_tokens": client_conf.get("max_tokens", AI_CONFIG["max_tokens"]),
+        "openai_model": client_conf.get("openai_model", AI_CONFIG["openai_model"]),
+        "embedding_model": client_conf.get("embedding_model", AI_CONFIG["embedding_model"]),
+        # Dimension réduite des embeddings (doit correspondre à celle utilisée à l'indexation)
+        "embedding_dimensions": client_conf.get("embedding_dimensions"),
+        "chroma_dir": chroma_dir,
+        "collection_name": client_conf.get("collection_name", AI_CONFIG["collection_name"]),
+        "retrieval_engine": retrieval_engine,
+        "vector_dir": vector_dir,
+        # Recherche hybride BM25 + vecteurs (optionnelle)
+        "hybrid": hybrid_settings(client_conf),
+        "lexical_index_path": str(CLIENTS_PATH / client_id / LEXICAL_INDEX_FILE),
+        "context_token_budget": client_conf.get("context_token_budget", AI_CONFIG["context_token_budget"]),
+        # Fournisseur de modèles : "openai" ou "local" (substitut hors ligne), cf. providers.py
+        "provider": get_provider(client_conf.get("provider")),
+        # Réponse renvoyée si l'API est indisponible ou trop lente
+        "fallback_answer": client_conf.get("fallback_answer", FALLBACK_ANSWER),
+        # Nombre maximal d'appels simultanés vers l'API pour ce client (chemin asynchrone)
+        "max_concurrency": client_conf.get("max_concurrency"),
+        # Cache sémantique des réponses (optionnel, activé dans le config.json du client)
+        "answer_cache": answer_cache_settings(client_conf),
+        "cache_version": paths_version(CLIENTS_PATH / client_id / "config.json", index_dir),
+    }
+
+def new_request_state(user_question, settings):
+    return {
+        "question": user_question,
+        "settings": settings,
+        "cached_answer": None,
+        "contexts": [],
+        "prompt": None,
+        "prompt_tokens": 0,
+        "query_embedding": None,
+        "lexical_results": None,
+        # Budget de latence commun à l'embedding et à la complétion
+        "deadline": Deadline(),
+    }
+
+def lookup_cached_answer(state):
+    settings = state["settings"]
+    if settings["answer_cache"]:
+        with timed("answer_cache", settings["client_id"]):
+            state["cached_answer"] = answer_cache.lookup(
+                settings["client_id"], settings["cache_version"], state["question"],
+                state["query_embedding"], settings["answer_cache"]
+            )
+    return state["cached_answer"]
+
+def lexical_fast_path(state):
+    """
+    Recherche lexicale préalable (recherche hybride) : si le résultat est décisif,
+    le prompt est construit sans appel à l'API d'embeddings. Retourne True dans ce cas.
+    """
+    settings = state["settings"]
+    hybrid = settings["hybrid"]
+    if not hybrid or not os.path.exists(settings["lexical_index_path"]):
+        return False
+    with timed("lexical", settings["client_id"]):
+        state["lexical_results"] = search_lexical(
+            state["question"], settings["lexical_index_path"], max(settings["top_k"], hybrid["candidates"])
+        )
+    if not hybrid["lexical_fast_path"] or not is_decisive(
+        [(None, p["score"]) for p in state["lexical_results"]], hybrid
+    ):
+        return False
+    build_request_prompt(state, state["lexical_results"][:settings["top_k"]])
+    return True
+
+def build_request_prompt(state, contexts):
+    settings = state["settings"]
+    with timed("prompt", settings["client_id"]):
+        # Passages retenus dans le budget de tokens du client, par ordre de pertinence
+        state["contexts"], state["prompt_tokens"] = assemble_contexts(
+            contexts, settings["context_token_budget"], settings["openai_model"]
+        )
+        state["prompt"] = build_prompt(state["question"], state["contexts"], settings["system_prompt"])
+    return state
+
+def retrieve_contexts(state):
+    return retrieve_contexts_many([state])[0]
+
+def retrieve_contexts_many(states):
+    """Recherche groupée pour plusieurs questions d'un même client (une requête à l'index)"""
+    settings = states[0]["settings"]
+    top_k = settings["top_k"]
+    if settings["hybrid"]:
+        # Plus de candidats vectoriels, fusionnés ensuite avec les résultats BM25
+        top_k = max(top_k, settings["hybrid"]["candidates"])
+    query_embeddings = [state["query_embedding"] for state in states]
+    with timed("retrieval", settings["client_id"]):
+        if settings["retrieval_engine"] == "numpy":
+            results = search_vector_index_many(settings["vector_dir"], query_embeddings, top_k)
+        else:
+            results = search_chroma_many(settings["chroma_dir"], settings["collection_name"], query_embeddings, top_k)
+    for state, contexts in zip(states, results):
+        if state["lexical_results"] is not None:
+            contexts = reciprocal_rank_fusion([contexts, state["lexical_results"]], settings["top_k"])
+        else:
+            contexts = contexts[:settings["top_k"]]
+        build_request_prompt(state, contexts)
+    return states
+
+def prepare_request(user_question, client_id="default"):
+    """Étapes communes à /ask et /ask/stream : config, embedding, cache de réponses et recherche"""
+    with timed("config", client_id):
+        settings = get_client_settings(client_id)
+    state = new_request_state(user_question, settings)
+    if lexical_fast_path(state):
+        return state
+    with timed("embedding", client_id):
+        state["query_embedding"] = get_embedding(
+            user_question, settings["embedding_model"], settings["embedding_dimensions"],
+            state["deadline"], settings["provider"]
+        )
+    if lookup_cached_answer(state) is not None:
+        return state
+    return retrieve_contexts(state)
+
+def remember_answer(state, answer):
+    settings = state["settings"]
+    # Pas de mise en cache sans embedding (réponse obtenue par la recherche lexicale seule)
+    if settings["answer_cache"] and state["query_embedding"] is not None:
+        answer_cache.store(
+            settings["client_id"], settings["cache_version"], state["question"],
+            state["query_embedding"], answer, settings["answer_cache"]
+        )
+
+def inflight_key(user_question, client_id):
+    """Clé de regroupement : client, question normalisée et version de sa config"""
+    return (client_id, normalize_question(user_question), config_version(client_id))
+
+def chatbot_response(user_question, client_id="default"):
+    return chatbot_answer(user_question, client_id)[0]
+
+def chatbot_answer(user_question, client_id="default"):
+    """(réponse, embedding de la question ou None) : l'embedding est conservé dans le log (question_vectors.py)"""
+    if SINGLE_FLIGHT_ENABLED:
+        return inflight_questions.do(
+            inflight_key(user_question, client_id),
+            lambda: compute_response(user_question, client_id)
+        )
+    return compute_response(user_question, client_id)
+
+def fallback_answer(client_id):
+    fallback_answers.inc(client=client_label(client_id))
+    return load_client_config(client_id).get("fallback_answer", FALLBACK_ANSWER)
+
+def compute_response(user_question, client_id="default"):
+    try:
+        state = prepare_request(user_question, client_id)
+        if state["cached_answer"] is not None:
+            return state["cached_answer"], state["query_embedding"]
+
+        settings = state["settings"]
+        with timed("completion", client_id):
+            answer = ask_gpt(
+                state["prompt"], settings["system_prompt"], settings["openai_model"],
+                settings["temperature"], settings["max_tokens"], state["deadline"], settings["provider"]
+            )
+    except UpstreamError as e:
+        print(f"API indisponible pour {client_id} : {e}")
+        return fallback_answer(client_id), None
+    remember_answer(state, answer)
+    return answer, state["query_embedding"]
+
+def chatbot_response_stream(user_question, client_id="default"):
+    """
+    Générateur d'événements (type, données) pour /ask/stream :
+    les sources retrouvées d'abord, puis les morceaux de réponse, puis la réponse complète.
+    Un événement "embedding" (vecteur de la question ou None), non transmis au client, précède la réponse.
+    """
+    try:
+        state = prepare_request(user_question, client_id)
+    except UpstreamError as e:
+        print(f"API indisponible pour {client_id} : {e}")
+        state = new_request_state(user_question, get_client_settings(client_id))
+        state["cached_answer"] = state["settings"]["fallback_answer"]
+        fallback_answers.inc(client=client_label(client_id))
+    yield "sources", {
+        "sources": [
+            {"title": c["title"], "url": c["url"], "modified": c["modified"]}
+            for c in state["contexts"]
+        ],
+        "context_tokens": state["prompt_tokens"],
+    }
+    yield "embedding", state["query_embedding"]
+
+    if state["cached_answer"] is not None:
+        yield "delta", state["cached_answer"]
+        yield "done", state["cached_answer"]
+        return
+
+    settings = state["settings"]
+    start = time.perf_counter()
+    try:
+        deltas = ask_gpt_stream(
+            state["prompt"], settings["system_prompt"], settings["openai_model"],
+            settings["temperature"], settings["max_tokens"], state["deadline"], settings["provider"]
+        )
+    except UpstreamError as e:
+        print(f"API indisponible pour {client_id} : {e}")
+        fallback_answers.inc(client=client_label(client_id))
+        yield "delta", settings["fallback_answer"]
+        yield "done", settings["fallback_answer"]
+        return
+    parts = []
+    try:
+        for delta in deltas:
+            if not parts:
+                stage_seconds.observe(time.perf_counter() - start, stage="first_token", client=client_label(client_id))
+            parts.append(delta)
+            yield "delta", delta
+    except UpstreamError as e:
+        # Flux coupé en cours de génération : la réponse partielle est remplacée par la réponse de repli
+        print(f"Flux interrompu pour {client_id} : {e}")
+        fallback_answers.inc(client=client_label(client_id))
+        yield "delta", ("\n\n" if parts else "") + settings["fallback_answer"]
+        yield "done", settings["fallback_answer"]
+        return
+    stage_seconds.observe(time.perf_counter() - start, stage="completion", client=client_label(client_id))
+    answer = "".join(parts).strip()
+    remember_answer(state, answer)
+    yield "done", answer
+
+def chatbot_response_batch(items):
+    """
+    Réponses pour une liste de (client_id, question) : config chargée une fois par client,
+    embeddings en un appel par modèle, recherche groupée par client et complétions en parallèle.
+    Retourne, dans l'ordre des entrées, {"answer": ..., "embedding": ...} ou {"error": ...} pour chaque
+    élément (embedding de la question pour le log, None après une recherche lexicale).
+    """
+    results = [None] * len(items)
+    states = {}
+    settings_by_client = {}
+
+    for i, (client_id, question) in enumerate(items):
+        try:
+            if client_id not in settings_by_client:
+                settings_by_client[client_id] = get_client_settings(client_id)
+            state = new_request_state(question, settings_by_client[client_id])
+            lexical_fast_path(state)
+            states[i] = state
+        except Exception as e:
+            results[i] = {"error": str(e)}
+
+    # Un seul appel d'embeddings par (modèle, dimension), sauf réponses trouvées par recherche lexicale
+    by_model = defaultdict(list)
+    for i, state in states.items():
+        if state["prompt"] is None:
+            settings = state["settings"]
+            by_model[(settings["provider"].name, settings["embedding_model"], settings["embedding_dimensions"])].append(i)
+    for (provider_name, model, dimensions), indexes in by_model.items():
+        try:
+            # Un seul appel pour tout le groupe : son propre budget de latence
+            embeddings = get_embeddings(
+                [states[i]["question"] for i in indexes], model, dimensions,
+                deadline=Deadline(), provider=get_provider(provider_name)
+            )
+        except UpstreamError as e:
+            # Comme /ask : réponse de repli du client plutôt qu'une erreur
+            print(f"API indisponible pour le lot ({model}) : {e}")
+            for i in indexes:
+                results[i] = {"answer": fallback_answer(states[i]["settings"]["client_id"]), "embedding": None}
+                del states[i]
+            continue
+        except Exception as e:
+            for i in indexes:
+                results[i] = {"error": str(e)}
+                del states[i]
+            continue
+        for i, embedding in zip(indexes, embeddings):
+            states[i]["query_embedding"] = embedding
+            if lookup_cached_answer(states[i]) is not None:
+                results[i] = {"answer": states[i]["cached_answer"], "embedding": embedding}
+                del states[i]
 
-    contexts = search_chroma(user_question, chroma_dir, collection_name, embedding_model, top_k)
-    prompt = build_prompt(user_question, contexts, system_prompt)
-    return ask_gpt(prompt, system_prompt, openai_model, temperature, max_tokens)
+    # Recherche groupée par client
+    by_client = defaultdict(list)
+    for i, state in states.items():
+        if state["prompt"] is None:
+            by_client[state["settings"]["client_id"]].append(i)
+    for indexes in by_client.values():
+        try:
+            retrieve_contexts_many([states[i] for i in indexes])
+        except Exception as e:
+            for i in indexes:
+                results[i] = {"error": str(e)}
+                del states[i]
 
+    def complete(state):
+        settings = state["settings"]
+        # Budget compté à partir du début de la complétion, pas de la mise en file d'attente du lot
+        state["deadline"] = Deadline()
+        try:
+            with timed("completion", settings["client_id"]):
+                answer = ask_gpt(
+                    state["prompt"], settings["system_prompt"], settings["openai_model"],
+                    settings["temperature"], settings["max_tokens"], state["deadline"], settings["provider"]
+                )
+        except UpstreamError as e:
+            print(f"API indisponible pour {settings['client_id']} : {e}")
+            return fallback_answer(settings["client_id"]), None
+        remember_answer(state, answer)
+        return answer, state["query_embedding"]
 
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as pool:
+        futures = {i: pool.submit(complete, state) for i, state in states.items()}
+        for i, future in futures.items():
+            try:
+                answer, embedding = future.result()
+                results[i] = {"answer": answer, "embedding": embedding}
+            except Exception as e:
+                results[i] = {"error": str(e)}
+    return results
 
@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from shared_files import file_lock, write_json_atomic
+
+# Chemin des clients, défini par la variable d'environnement CHATBOT_CLIENTS_PATH
+CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
+
+# Clés numériques contrôlées au chargement : (type, minimum, maximum)
+# Une valeur invalide est ignorée (la valeur par défaut s'applique) avec un avertissement.
+CONFIG_SCHEMA = {
+    "top_k_results": (int, 1, 50),
+    "max_tokens": (int, 1, 4096),
+    "temperature": (float, 0.0, 2.0),
+    "max_concurrency": (int, 1, 1000),
+    "context_token_budget": (int, 100, 100000),
+    "embedding_dimensions": (int, 64, 3072),
+    "logs_months_to_keep": (int, 1, 120),
+}
+
+_cache = {}  # client_id -> (signature, config brute, config validée)
+_lock = threading.Lock()
+
+
+def config_path(client_id):
+    return CLIENTS_PATH / client_id / "config.json"
+
+
+def config_version(client_id):
+    """Signature (mtime, taille, inode) du config.json, ou None s'il n'existe pas"""
+    try:
+        st = os.stat(config_path(client_id))
+    except OSError:
+        return None
+    # L'inode change à chaque save_client_config (os.replace), même si mtime et taille sont identiques
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def validate_client_config(client_id, config):
+    """Retourne une copie de la config sans les valeurs hors bornes définies par CONFIG_SCHEMA"""
+    validated = dict(config)
+    for key, (expected, minimum, maximum) in CONFIG_SCHEMA.items():
+        if key not in validated:
+            continue
+        value = validated[key]
+        # Le plugin WordPress peut envoyer les nombres sous forme de chaînes
+        if isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+        if valid and expected is int:
+            valid = float(value).is_integer()
+        if valid and not minimum <= value <= maximum:
+            valid = False
+        if valid:
+            validated[key] = expected(value)
+        else:
+            print(f"Config {client_id} : valeur invalide pour {key} ({validated[key]!r}), valeur par défaut utilisée")
+            del validated[key]
+    return validated
+
+
+def load_client_config(client_id, required=False, validated=True):
+    """
+    Charge le config.json d'un client, avec un cache revalidé par stat() (mtime et taille).
+    La config retournée est partagée : elle ne doit pas être modifiée par l'appelant.
+    """
+    signature = config_version(client_id)
+    if signature is None:
+        with _lock:
+            _cache.pop(client_id, None)
+        if required:
+            raise FileNotFoundError(f"Config client introuvable : {config_path(client_id)}")
+        return {}
+
+    with _lock:
+        entry = _cache.get(client_id)
+    if entry is None or entry[0] != signature:
+        with open(config_path(client_id), "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        entry = (signature, raw, validate_client_config(client_id, raw))
+        with _lock:
+            _cache[client_id] = entry
+    return entry[2] if validated else entry[1]
+
+
+def save_client_config(client_id, config):
+    """
+    Écrit le config.json d'un client de façon atomique, sous verrou inter-processus.
+    Les autres workers voient la nouvelle config au prochain stat() (signature modifiée).
+    """
+    path = config_path(client_id)
+    with file_lock(path):
+        write_json_atomic(path, config, indent=2)
+    invalidate_client_config(client_id)
+
+
+def invalidate_client_config(client_id=None):
+    """À appeler après toute écriture d'un config.json (ou suppression d'un client)"""
+    with _lock:
+        if client_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(client_id, None)
@@ -0,0 +1,164 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Budget du registre, réglable par variables d'environnement :
+# - CHATBOT_MAX_OPEN_COLLECTIONS : nombre maximum de collections ouvertes simultanément
+# - CHATBOT_COLLECTIONS_MEMORY_MB : taille cumulée maximale (approximée par la taille sur disque)
+MAX_OPEN_COLLECTIONS = int(os.environ.get("CHATBOT_MAX_OPEN_COLLECTIONS", "32"))
+COLLECTIONS_MEMORY_MB = int(os.environ.get("CHATBOT_COLLECTIONS_MEMORY_MB", "1024"))
+
+
+def path_signature(path):
+    """Identité d'un index sur disque : change lorsqu'un nouveau dossier/fichier est renommé à sa place"""
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino)
+
+
+def directory_size(path):
+    """Taille totale des fichiers d'un dossier (estimation de l'empreinte mémoire de l'index)"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+class _Entry:
+    __slots__ = ("handle", "signature", "size", "closer", "users", "retired")
+
+    def __init__(self, handle, signature, size, closer):
+        self.handle = handle
+        self.signature = signature
+        self.size = size
+        self.closer = closer
+        self.users = 0
+        self.retired = False
+
+
+class CollectionRegistry:
+    """
+    Registre process-wide des index ouverts par client, avec éviction LRU.
+
+    Chaque entrée est identifiée par une clé (ex: (chroma_dir, collection_name)) et par
+    la signature du dossier sur disque : lorsque index_embeddings.build_chroma_collection
+    remplace chroma_db par chroma_db_new, la signature change et l'index est rouvert.
+    Une entrée évincée ou périmée n'est fermée qu'une fois la dernière requête en cours terminée.
+    """
+
+    def __init__(self, max_handles=MAX_OPEN_COLLECTIONS, max_bytes=COLLECTIONS_MEMORY_MB * 1024 * 1024):
+        self.max_handles = max_handles
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._open_locks = {}
+        self.stats = {"hits": 0, "opens": 0, "reopens": 0, "evictions": 0}
+
+    def _open_lock(self, key):
+        with self._lock:
+            lock = self._open_locks.get(key)
+            if lock is None:
+                lock = self._open_locks[key] = threading.Lock()
+            return lock
+
+    def _lookup(self, key, signature):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.signature != signature:
+            # L'index a été reconstruit : on retire l'ancienne entrée
+            self._retire(key, entry)
+            self.stats["reopens"] += 1
+            return None
+        self._entries.move_to_end(key)
+        entry.users += 1
+        self.stats["hits"] += 1
+        return entry
+
+    def _retire(self, key, entry):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+        entry.retired = True
+        if entry.users == 0:
+            _close_entry(entry)
+
+    def _evict(self, keep_key):
+        total = sum(e.size for e in self._entries.values())
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_handles and (not self.max_bytes or total <= self.max_bytes):
+                break
+            if key == keep_key:
+                continue
+            entry = self._entries[key]
+            total -= entry.size
+            self._retire(key, entry)
+            self.stats["evictions"] += 1
+
+    @contextmanager
+    def acquire(self, key, path, opener, closer=None):
+        """
+        Fournit l'index associé à `key`, en l'ouvrant via `opener(path)` si nécessaire.
+        `closer(handle)` est appelé quand l'index est évincé ou remplacé.
+        """
+        signature = path_signature(path)
+        with self._lock:
+            entry = self._lookup(key, signature)
+        if entry is None:
+            with self._open_lock(key):
+                # Un autre thread a pu ouvrir l'index pendant l'attente
+                with self._lock:
+                    entry = self._lookup(key, signature)
+                if entry is None:
+                    handle = opener(path)
+                    entry = _Entry(handle, signature, directory_size(path), closer)
+                    with self._lock:
+                        previous = self._entries.get(key)
+                        if previous is not None:
+                            self._retire(key, previous)
+                        self._entries[key] = entry
+                        entry.users += 1
+                        self.stats["opens"] += 1
+                        self._evict(keep_key=key)
+        try:
+            yield entry.handle
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.retired and entry.users == 0:
+                    _close_entry(entry)
+
+    def invalidate(self, key=None):
+        """Retire une entrée (ou toutes) : elle sera rouverte au prochain accès"""
+        with self._lock:
+            keys = [key] if key is not None else list(self._entries)
+            for k in keys:
+                entry = self._entries.get(k)
+                if entry is not None:
+                    self._retire(k, entry)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "open": len(self._entries),
+                "bytes": sum(e.size for e in self._entries.values()),
+                **self.stats,
+            }
+
+
+def _close_entry(entry):
+    if entry.closer is None:
+        return
+    try:
+        entry.closer(entry.handle)
+    except Exception as e:
+        print(f"Erreur lors de la fermeture d'un index : {e}")
+
+
+# Registre partagé par tout le processus
+registry = CollectionRegistry()
@@ -0,0 +1,173 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+# Chemin des clients, défini par la variable d'environnement CHATBOT_CLIENTS_PATH
+CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
+
+# Cache des embeddings de questions :
+# - CHATBOT_EMBEDDING_CACHE : "0" pour désactiver le cache
+# - CHATBOT_EMBEDDING_CACHE_PATH : base SQLite persistante (par défaut data/cache/embeddings.sqlite3)
+# - CHATBOT_EMBEDDING_CACHE_SIZE : nombre d'entrées gardées en mémoire
+# - CHATBOT_EMBEDDING_CACHE_MAX_ROWS : nombre maximal d'entrées sur disque
+CACHE_ENABLED = os.environ.get("CHATBOT_EMBEDDING_CACHE", "1") != "0"
+CACHE_PATH = Path(os.environ.get("CHATBOT_EMBEDDING_CACHE_PATH", str(CLIENTS_PATH.parent / "cache" / "embeddings.sqlite3")))
+MEMORY_SIZE = int(os.environ.get("CHATBOT_EMBEDDING_CACHE_SIZE", "2048"))
+MAX_ROWS = int(os.environ.get("CHATBOT_EMBEDDING_CACHE_MAX_ROWS", "100000"))
+# Hits disque accumulés avant d'écrire leur date de dernière utilisation (purge LRU approchée)
+TOUCH_BATCH = 100
+
+
+def normalize_question(text):
+    """Forme canonique d'une question : casse, espaces et espaces avant ponctuation"""
+    text = unicodedata.normalize("NFC", text).strip().lower()
+    text = re.sub(r"\s+", " ", text)
+    return re.sub(r"\s+([?!.,;:])", r"\1", text)
+
+
+class EmbeddingCache:
+    """Cache à deux niveaux (LRU mémoire + SQLite) des embeddings, par modèle et question normalisée"""
+
+    def __init__(self, path=CACHE_PATH, memory_size=MEMORY_SIZE, max_rows=MAX_ROWS):
+        self.path = Path(path)
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self._memory = OrderedDict()
+        # _lock protège le LRU mémoire et les compteurs, _db_lock la connexion SQLite :
+        # une lecture disque ne bloque pas les hits mémoire des autres threads
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        # Dates de dernière utilisation des hits disque, écrites par lots (TOUCH_BATCH ou au prochain put)
+        self._touched = {}
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _db(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL, PRIMARY KEY (model, text))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+            self._conn = conn
+        return self._conn
+
+    def _after_fork(self):
+        # Une connexion SQLite ne doit pas être partagée entre processus : chaque worker rouvre la sienne
+        self._conn = None
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._touched = {}
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _take_touched(self):
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        return [(last_used, *key) for key, last_used in touched.items()]
+
+    def _write_touched(self, db, touched):
+        db.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND text = ?", touched)
+
+    def flush(self):
+        """Écrit les dates de dernière utilisation en attente"""
+        touched = self._take_touched()
+        if not touched:
+            return
+        try:
+            with self._db_lock:
+                db = self._db()
+                self._write_touched(db, touched)
+                db.commit()
+        except sqlite3.Error as e:
+            print(f"Erreur d'écriture du cache d'embeddings : {e}")
+
+    def get(self, text, model):
+        key = (model, normalize_question(text))
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return vector
+        try:
+            with self._db_lock:
+                row = self._db().execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text = ?", key
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Erreur de lecture du cache d'embeddings : {e}")
+            row = None
+        if row is None:
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+        vector = array("f")
+        vector.frombytes(row[0])
+        vector = vector.tolist()
+        with self._lock:
+            self._remember(key, vector)
+            self.counters["disk_hits"] += 1
+            self._touched[key] = time.time()
+            flush = len(self._touched) >= TOUCH_BATCH
+        if flush:
+            self.flush()
+        return vector
+
+    def put(self, text, model, vector):
+        key = (model, normalize_question(text))
+        with self._lock:
+            self._remember(key, list(vector))
+            self._touched.pop(key, None)
+        touched = self._take_touched()
+        try:
+            with self._db_lock:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, text, vector, last_used) VALUES (?, ?, ?, ?)",
+                    (*key, array("f", vector).tobytes(), time.time()),
+                )
+                if touched:
+                    self._write_touched(db, touched)
+                self._writes += 1
+                # Purge périodique des entrées les moins récemment utilisées
+                if self._writes % 1000 == 0:
+                    db.execute(
+                        "DELETE FROM embeddings WHERE rowid IN ("
+                        " SELECT rowid FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                        (self.max_rows,),
+                    )
+                db.commit()
+        except sqlite3.Error as e:
+            print(f"Erreur d'écriture du cache d'embeddings : {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = sum(self.counters.values())
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            return {
+                **self.counters,
+                "memory_entries": len(self._memory),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Cache partagé par tout le processus
+embedding_cache = EmbeddingCache()
+os.register_at_fork(after_in_child=embedding_cache._after_fork)
@@ -0,0 +1,70 @@
+"""
+Serveur de production multi-processus (pré-fork) :
+
+    gunicorn -c scripts/gunicorn.conf.py
+
+Le maître importe le backend (chromadb, numpy, modules partagés) et précharge les index en
+lecture seule (numpy, BM25) avant de créer les workers, qui en héritent. Chaque worker ouvre
+ensuite ses propres collections Chroma (démarrage à chaud si CHATBOT_WARMUP=1).
+
+Réglages par variables d'environnement :
+- CHATBOT_WORKERS : nombre de processus (par défaut : un par cœur)
+- CHATBOT_THREADS : threads par processus (les appels à l'API sont majoritairement en attente réseau)
+- CHATBOT_BIND : adresse d'écoute
+- CHATBOT_WORKER_TIMEOUT : délai (s) avant redémarrage d'un worker bloqué
+"""
+import gc
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+# Les modules du backend sont importés par leur nom (comme avec python scripts/backend.py) ;
+# le répertoire courant reste la racine du projet pour les sous-processus de /update_data
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, pythonpath)
+
+wsgi_app = "backend:app"
+bind = os.environ.get("CHATBOT_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("CHATBOT_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("CHATBOT_THREADS", "8"))
+# Les réponses en streaming (/ask/stream) et les complétions lentes dépassent le délai par défaut (30 s)
+timeout = int(os.environ.get("CHATBOT_WORKER_TIMEOUT", "120"))
+preload_app = True
+accesslog = "-"
+
+# Métriques agrégées entre workers (cf. metrics.py) : défini avant l'import du backend
+_metrics_dir = os.environ.setdefault("CHATBOT_METRICS_DIR", os.path.join(tempfile.gettempdir(), "chatbot-metrics"))
+shutil.rmtree(_metrics_dir, ignore_errors=True)
+os.makedirs(_metrics_dir, exist_ok=True)
+
+
+def when_ready(server):
+    # Exécuté dans le maître, avant la création des workers
+    from warmup import warmer
+    warmer.preload_shared()
+    # Objets chargés jusqu'ici exclus du ramasse-miettes : leurs pages restent partagées (copy-on-write)
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from log_maintenance import log_maintenance
+    from metrics import metrics
+    from warmup import warmer
+    metrics.start_flusher()
+    warmer.start()
+    # Chaque worker planifie la maintenance des logs ; un seul l'exécute à la fois (verrou)
+    log_maintenance.start()
+
+
+def worker_exit(server, worker):
+    from metrics import metrics
+    from question_log import question_log
+    # Questions encore en file d'attente écrites avant l'arrêt du worker
+    question_log.flush()
+    try:
+        metrics.write_state()
+    except Exception:
+        pass
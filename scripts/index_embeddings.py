@@ -7,6 +7,10 @@ import chromadb
 from tqdm import tqdm
 from dotenv import load_dotenv
 from pathlib import Path
+from client_config import load_client_config
+from vector_index import write_vector_index
+from lexical_index import LEXICAL_INDEX_FILE, build_lexical_index
+from providers import get_provider
 
 load_dotenv(dotenv_path=Path(__file__).resolve().parent / ".env", override=True)
 
@@ -29,6 +33,8 @@ def get_client_paths(client_id):
         "content_file": base_path / "content.json",
         "manual_file": base_path / "manual_content.json",
         "chroma_dir": base_path / "chroma_db",
+        "vector_dir": base_path / "vector_index",
+        "lexical_index": base_path / LEXICAL_INDEX_FILE,
     }
 
 def load_content(content_file, manual_file):
@@ -89,12 +95,10 @@ def chunk_text(text, max_length):
         chunks.append(current.strip())
     return chunks
 
-def get_embedding(text):
-    response = openai.embeddings.create(
-        input=text,
-        model=EMBEDDING_MODEL
-    )
-    return response.data[0].embedding
+def get_embedding(text, dimensions=None, provider=None):
+    # Dimension réduite optionnelle (text-embedding-3-*), définie par "embedding_dimensions"
+    options = {"dimensions": dimensions} if dimensions else {}
+    return get_provider(provider).embed([text], EMBEDDING_MODEL, **options)[0]
 
 def build_chroma_collection(client_id):
     paths = get_client_paths(client_id)
@@ -111,12 +115,19 @@ def build_chroma_collection(client_id):
     if chroma_dir_tmp.exists():
         shutil.rmtree(chroma_dir_tmp)
 
+    client_conf = load_client_config(client_id)
+    dimensions = client_conf.get("embedding_dimensions")
+    provider = client_conf.get("provider")
+
     # Création de la nouvelle base dans le dossier temporaire
     if hasattr(chromadb, "PersistentClient"):
         client = chromadb.PersistentClient(path=str(chroma_dir_tmp))
     else:
         client = chromadb.Client()  # Pas de persistance si pas de PersistentClient
-    collection = client.create_collection(COLLECTION_NAME)
+    collection = client.create_collection(
+        COLLECTION_NAME,
+        metadata={"embedding_dimensions": dimensions} if dimensions else None
+    )
 
     contents = load_content(paths["content_file"], paths["manual_file"])
     all_chunks, metadatas, ids = [], [], []
@@ -139,7 +150,7 @@ def build_chroma_collection(client_id):
 
     embeddings = []
     for chunk in tqdm(all_chunks):
-        emb = get_embedding(chunk)
+        emb = get_embedding(chunk, dimensions, provider)
         embeddings.append(emb)
 
     collection.add(
@@ -150,11 +161,26 @@ def build_chroma_collection(client_id):
     )
 
     # Swap atomique : on ne remplace l'ancienne base que si la nouvelle est prête
+    # (le nouveau dossier change d'inode : le registre du backend rouvre alors la collection)
     if chroma_dir.exists():
         shutil.rmtree(chroma_dir)
     chroma_dir_tmp.rename(chroma_dir)
     print(f"Embeddings indexés dans {chroma_dir}")
 
+    # Index inversé BM25 pour la recherche hybride (peu coûteux : toujours construit)
+    build_lexical_index(paths["lexical_index"], ids, all_chunks, metadatas)
+    print(f"Index lexical écrit dans {paths['lexical_index']}")
+
+    # Index numpy (memmap) si le client l'utilise comme moteur de recherche
+    if client_conf.get("retrieval_engine") == "numpy":
+        write_vector_index(
+            client_conf.get("vector_index_dir", paths["vector_dir"]),
+            ids, all_chunks, metadatas, embeddings, EMBEDDING_MODEL,
+            dtype=client_conf.get("vector_dtype", "float32"),
+            rescore=client_conf.get("vector_rescore", False)
+        )
+        print(f"Index numpy écrit dans {client_conf.get('vector_index_dir', paths['vector_dir'])}")
+
     # Suppression du fichier should_index.txt après indexation
     if should_index_file.exists():
         os.remove(should_index_file)
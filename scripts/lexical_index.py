@@ -0,0 +1,146 @@
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+
+# Index inversé BM25 par client, construit par index_embeddings.py à côté de chroma_db.
+LEXICAL_INDEX_FILE = "lexical_index.json"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Constante de la fusion par rang réciproque (Reciprocal Rank Fusion)
+RRF_K = 60
+
+# Valeurs par défaut de la section "hybrid_search" du config.json client :
+# "hybrid_search": {"enabled": true, "lexical_fast_path": true, "decisive_ratio": 2.0, "min_score": 6.0, "candidates": 20}
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "lexical_fast_path": True,
+    "decisive_ratio": 2.0,
+    "min_score": 6.0,
+    "candidates": 20,
+}
+
+STOPWORDS = {
+    "le", "la", "les", "un", "une", "des", "du", "de", "d", "l", "en", "et", "ou", "a", "au", "aux",
+    "pour", "par", "sur", "avec", "sans", "dans", "ce", "cet", "cette", "ces", "mon", "ma", "mes",
+    "ton", "ta", "tes", "son", "sa", "ses", "notre", "nos", "votre", "vos", "leur", "leurs", "je",
+    "j", "tu", "il", "elle", "on", "nous", "vous", "ils", "elles", "y", "est", "suis", "es", "sont",
+    "etes", "ete", "etre", "ai", "as", "avons", "avez", "ont", "avoir", "fait", "fais", "faites",
+    "font", "faire", "plus", "moins", "tres", "peu", "comment", "quoi", "quel", "quelle", "quels",
+    "quelles", "qui", "que", "qu", "quand", "donc", "si", "ca", "c", "se", "s", "ne",
+    "pas", "n", "m", "t", "me", "te", "lui", "puis", "peux", "peut", "pouvez", "est-ce", "bonjour",
+}
+
+
+def strip_accents(text):
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Tokenisation adaptée au français : minuscules, sans accents, sans mots vides, pluriels simples"""
+    tokens = []
+    for word in re.findall(r"\w+", strip_accents(text.lower())):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        # Racinisation légère : "flyers" -> "flyer", "travaux" -> "travau"
+        if len(word) > 3 and word[-1] in "sx":
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def hybrid_settings(client_conf):
+    """Paramètres de recherche hybride du client, ou None si elle n'est pas activée"""
+    conf = client_conf.get("hybrid_search")
+    if not isinstance(conf, dict) or not conf.get("enabled"):
+        return None
+    return {**DEFAULT_SETTINGS, **conf}
+
+
+def build_lexical_index(index_path, ids, documents, metadatas):
+    """Construit l'index inversé et l'écrit de façon atomique (fichier temporaire puis os.replace)"""
+    postings = defaultdict(list)
+    doc_lengths = []
+    for position, document in enumerate(documents):
+        counts = Counter(tokenize(document))
+        doc_lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings[term].append([position, tf])
+    index = {
+        "ids": list(ids),
+        "documents": list(documents),
+        "titles": [m.get("title", "") for m in metadatas],
+        "urls": [m.get("url", "") for m in metadatas],
+        "modified": [m.get("modified", "") for m in metadatas],
+        "doc_lengths": doc_lengths,
+        "postings": postings,
+    }
+    index_path = Path(index_path)
+    tmp_path = index_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+
+class LexicalIndex:
+    def __init__(self, index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.ids = data["ids"]
+        self.documents = data["documents"]
+        self.titles = data["titles"]
+        self.urls = data["urls"]
+        self.modified = data["modified"]
+        self.doc_lengths = data["doc_lengths"]
+        self.postings = data["postings"]
+        self.avgdl = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        n = len(self.doc_lengths)
+        self.idf = {
+            term: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+
+    def search(self, query, top_k):
+        """Retourne [(position, score BM25)] triés par score décroissant"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf[term]
+            for position, tf in plist:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[position] / self.avgdl)
+                scores[position] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def passage(self, position):
+        return {
+            "id": self.ids[position],
+            "content": self.documents[position],
+            "modified": self.modified[position],
+            "title": self.titles[position],
+            "url": self.urls[position],
+        }
+
+
+def is_decisive(results, settings):
+    """Le résultat lexical suffit-il à lui seul (score élevé et nettement devant le suivant) ?"""
+    if not results or results[0][1] < settings["min_score"]:
+        return False
+    if len(results) == 1:
+        return True
+    return results[0][1] >= settings["decisive_ratio"] * results[1][1]
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """Fusionne plusieurs listes de passages (triées par pertinence) en dédoublonnant sur l'id"""
+    scores, passages = defaultdict(float), {}
+    for ranking in rankings:
+        for rank, passage in enumerate(ranking):
+            scores[passage["id"]] += 1.0 / (k + rank + 1)
+            passages.setdefault(passage["id"], passage)
+    best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [passages[i] for i in best]
@@ -0,0 +1,190 @@
+"""
+Maintenance des questions_logs en tâche de fond (et non plus pendant les requêtes /ask) :
+- rétention : suppression des mois au-delà de `logs_months_to_keep` (config client, 12 par défaut)
+- compression : les mois clos sont regroupés dans 2025-07.jsonl.gz, lu directement par question_log.py
+
+Un seul processus exécute chaque passe (verrou non bloquant), même avec plusieurs workers.
+
+Réglages par variables d'environnement :
+- CHATBOT_LOG_MAINTENANCE_INTERVAL : intervalle (s) entre deux passes ; "0" désactive le thread
+- CHATBOT_LOG_COMPRESS : "gzip" (par défaut) ou "none"
+- CHATBOT_LOG_COMPRESS_AFTER_DAYS : délai après la fin du mois avant compression (écritures tardives)
+
+Passe manuelle (cron) :
+    python log_maintenance.py [client_id ...]
+"""
+import argparse
+import fcntl
+import gzip
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import question_stats
+from analytics_store import analytics_store
+from client_config import load_client_config
+from question_log import archive_path, jsonl_path, legacy_path, list_months, logs_base_dir, migrate_month
+from shared_files import file_lock
+
+CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
+MAINTENANCE_INTERVAL_S = float(os.environ.get("CHATBOT_LOG_MAINTENANCE_INTERVAL", "3600"))
+COMPRESSION = os.environ.get("CHATBOT_LOG_COMPRESS", "gzip")
+COMPRESS_AFTER_DAYS = int(os.environ.get("CHATBOT_LOG_COMPRESS_AFTER_DAYS", "2"))
+DEFAULT_MONTHS_TO_KEEP = 12
+
+
+def months_ago(year, month, now):
+    return (now.year * 12 + now.month) - (int(year) * 12 + int(month))
+
+
+def cleanup_old_logs(client_id, months_to_keep=DEFAULT_MONTHS_TO_KEEP, now=None):
+    """Supprime les mois au-delà des `months_to_keep` derniers (mois en cours compris)"""
+    now = now or datetime.now()
+    base_dir = logs_base_dir(client_id)
+    removed = 0
+    for year, month in list_months(client_id):
+        if months_ago(year, month, now) < months_to_keep:
+            continue
+        shutil.rmtree(base_dir / year / month)
+        analytics_store.delete_period(client_id, f"{year}-{month}")
+        removed += 1
+        print(f"🗑️  Supprimé logs anciens: {client_id}/{year}/{month}")
+    if removed:
+        question_stats.invalidate(client_id)
+
+    # Nettoyer les dossiers d'années vides
+    if base_dir.exists():
+        for year_dir in base_dir.iterdir():
+            if year_dir.is_dir() and not any(year_dir.iterdir()):
+                year_dir.rmdir()
+                print(f"🗑️  Supprimé dossier année vide: {client_id}/{year_dir.name}")
+    return removed
+
+
+def compress_month(client_id, year, month):
+    """
+    Regroupe le JSONL du mois (et l'ancien JSON, converti d'abord) dans l'archive gzip.
+    Une écriture tardive recrée un JSONL à côté de l'archive : il sera fusionné à la passe suivante.
+    """
+    if legacy_path(client_id, year, month).exists():
+        migrate_month(client_id, year, month)
+    path = jsonl_path(client_id, year, month)
+    archive = archive_path(client_id, year, month)
+    with file_lock(path):
+        if not path.exists():
+            return 0
+        with open(path, "rb") as f:
+            data = f.read()
+        # Ligne finale incomplète (écriture interrompue) : ignorée, comme à la lecture
+        data = data[:data.rfind(b"\n") + 1]
+        tmp_path = archive.with_suffix(".gz.tmp")
+        with open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                if archive.exists():
+                    with gzip.open(archive, "rb") as current:
+                        shutil.copyfileobj(current, f)
+                f.write(data)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, archive)
+        path.unlink()
+    return len(data)
+
+
+def maintain_client(client_id, now=None):
+    now = now or datetime.now()
+    config = load_client_config(client_id)
+    cleanup_old_logs(client_id, config.get("logs_months_to_keep", DEFAULT_MONTHS_TO_KEEP), now)
+    if COMPRESSION != "gzip":
+        return
+    cutoff = now - timedelta(days=COMPRESS_AFTER_DAYS)
+    for year, month in list_months(client_id):
+        # Mois clos depuis plus de COMPRESS_AFTER_DAYS
+        if months_ago(year, month, cutoff) < 1:
+            continue
+        if not (jsonl_path(client_id, year, month).exists() or legacy_path(client_id, year, month).exists()):
+            continue
+        size = compress_month(client_id, year, month)
+        print(f"🗜️  Mois compressé: {client_id}/{year}/{month} ({size} octets)")
+
+
+def discover_clients():
+    if not CLIENTS_PATH.exists():
+        return []
+    return sorted(d.name for d in CLIENTS_PATH.iterdir() if d.is_dir() and (d / "config.json").exists())
+
+
+class LogMaintenance:
+    def __init__(self, interval=MAINTENANCE_INTERVAL_S):
+        self.interval = interval
+        self.last_run = None
+        self.last_duration = None
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Lance les passes périodiques en arrière-plan (une seule fois par processus)"""
+        with self._lock:
+            if self.interval <= 0 or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="log-maintenance", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        # Première passe peu après le démarrage, sans retarder le démarrage à chaud
+        time.sleep(min(60, self.interval))
+        while True:
+            self.run_once(force=False)
+            time.sleep(self.interval)
+
+    def run_once(self, client_ids=None, force=True):
+        """
+        Une passe sur les clients ; False si un autre processus l'exécute déjà, ou (sans `force`)
+        si un autre worker l'a exécutée il y a moins d'un demi-intervalle
+        """
+        if not CLIENTS_PATH.exists():
+            return True
+        lock_path = CLIENTS_PATH / ".log_maintenance.lock"
+        first_run = not lock_path.exists()
+        with open(lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                # La date de modification du verrou marque la dernière passe, tous workers confondus
+                if not force and not first_run and time.time() - os.stat(lock_path).st_mtime < self.interval / 2:
+                    return False
+                os.utime(lock_path)
+                start = time.time()
+                for client_id in client_ids or discover_clients():
+                    try:
+                        maintain_client(client_id)
+                    except Exception as e:
+                        self.errors += 1
+                        print(f"Erreur lors de la maintenance des logs de {client_id} : {e}")
+                self.last_run = start
+                self.last_duration = time.time() - start
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return True
+
+
+# Maintenance partagée par tout le processus
+log_maintenance = LogMaintenance()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("client_ids", nargs="*", help="Clients à traiter (tous par défaut)")
+    args = parser.parse_args()
+    if not log_maintenance.run_once(args.client_ids):
+        print("Maintenance déjà en cours dans un autre processus")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Métriques du processus au format texte Prometheus (exposées par /metrics).
+
+- chatbot_stage_duration_seconds{stage, client} : durée de chaque étape d'une réponse
+  (config, lexical, embedding, answer_cache, retrieval, prompt, completion, first_token, log)
+- chatbot_http_request_duration_seconds{endpoint, method, status} et
+  chatbot_http_requests_in_flight{endpoint} : vue HTTP
+- compteurs des caches, du regroupement des requêtes et des appels à l'API, lus au moment
+  de l'export dans les statistiques existantes (cf. register_collector)
+
+En mode multi-processus (CHATBOT_METRICS_DIR, défini par gunicorn.conf.py), chaque worker écrit
+ses valeurs dans <dossier>/<pid>.json toutes les CHATBOT_METRICS_FLUSH_INTERVAL secondes et
+/metrics additionne celles de tous les workers. Les jauges des workers arrêtés sont ignorées.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+from client_config import config_version
+from shared_files import write_json_atomic
+
+MULTIPROCESS_DIR = os.environ.get("CHATBOT_METRICS_DIR")
+FLUSH_INTERVAL_S = float(os.environ.get("CHATBOT_METRICS_FLUSH_INTERVAL", "5"))
+
+# Bornes des histogrammes (secondes) : du cache mémoire (ms) à la complétion lente (dizaines de s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Labels attendus pour {self.name} : {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{format_labels(zip(self.labelnames, key))} {format_value(value)}"
+            for key, value in items
+        ]
+
+    def render(self):
+        return self.header() + self.samples()
+
+    def dump(self):
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {"name": self.name, "kind": self.kind, "documentation": self.documentation,
+                "labelnames": list(self.labelnames), "values": values}
+
+    def merge(self, values):
+        """Ajoute les valeurs d'un autre processus (format de dump)"""
+        with self._lock:
+            for key, value in values:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def dump(self):
+        return super().dump() | {"buckets": list(self.buckets)}
+
+    def merge(self, values):
+        with self._lock:
+            for key, (counts, total, n) in values:
+                series = self._values.setdefault(tuple(key), [[0] * (len(self.buckets) + 1), 0.0, 0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+                series[2] += n
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Compteurs par borne (non cumulés), puis somme et nombre d'observations
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, ([*counts], total, n)) for key, (counts, total, n) in self._values.items())
+        lines = []
+        for key, (counts, total, n) in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(labels + [('le', format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {n}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        """`collector()` retourne des métriques construites à la volée, au moment de l'export"""
+        self._collectors.append(collector)
+
+    def collect(self):
+        collected = list(self._metrics)
+        for collector in self._collectors:
+            try:
+                collected.extend(collector())
+            except Exception as e:
+                print(f"Erreur lors de la collecte des métriques : {e}")
+        return collected
+
+    def render(self):
+        collected = self.collect()
+        if MULTIPROCESS_DIR:
+            self.write_state(collected)
+            collected = merge_workers(MULTIPROCESS_DIR)
+        lines = []
+        for metric in collected:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_state(self, collected=None):
+        """Mode multi-processus : écrit les valeurs du processus dans <dossier>/<pid>.json"""
+        collected = self.collect() if collected is None else collected
+        write_json_atomic(Path(MULTIPROCESS_DIR) / f"{os.getpid()}.json", [metric.dump() for metric in collected])
+
+    def start_flusher(self):
+        """Écriture périodique des valeurs du worker (à lancer après le fork)"""
+        def flush():
+            while True:
+                time.sleep(FLUSH_INTERVAL_S)
+                try:
+                    self.write_state()
+                except Exception as e:
+                    print(f"Erreur lors de l'écriture des métriques : {e}")
+        threading.Thread(target=flush, name="metrics-flush", daemon=True).start()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge_workers(directory):
+    """Additionne les métriques écrites par tous les workers (ordre des métriques conservé)"""
+    merged = {}
+    for path in sorted(Path(directory).glob("*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                dumps = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = _pid_alive(int(path.stem)) if path.stem.isdigit() else False
+        for dump in dumps:
+            if dump["kind"] == "gauge" and not alive:
+                continue
+            metric = merged.get(dump["name"])
+            if metric is None:
+                kind = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}[dump["kind"]]
+                extra = {"buckets": dump["buckets"]} if dump["kind"] == "histogram" else {}
+                metric = merged[dump["name"]] = kind(dump["name"], dump["documentation"], dump["labelnames"], **extra)
+            metric.merge(dump["values"])
+    return list(merged.values())
+
+
+# Registre partagé par tout le processus
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram(
+    "chatbot_stage_duration_seconds", "Durée des étapes d'une réponse, par client", ("stage", "client")
+)
+http_request_seconds = metrics.histogram(
+    "chatbot_http_request_duration_seconds", "Durée des requêtes HTTP", ("endpoint", "method", "status")
+)
+http_in_flight = metrics.gauge(
+    "chatbot_http_requests_in_flight", "Requêtes HTTP en cours de traitement", ("endpoint",)
+)
+fallback_answers = metrics.counter(
+    "chatbot_fallback_answers_total", "Réponses de repli renvoyées (API indisponible)", ("client",)
+)
+
+
+def client_label(client_id):
+    """
+    Valeur du label "client" : le client_id vient de la requête, il n'est repris que s'il a un
+    config.json (sinon "unknown"), pour ne pas créer une série (et un fichier en multiprocess) par valeur
+    """
+    if client_id and os.sep not in client_id and not client_id.startswith(".") and config_version(client_id) is not None:
+        return client_id
+    return "unknown"
+
+
+@contextmanager
+def timed(stage, client_id):
+    """Mesure la durée du bloc dans chatbot_stage_duration_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage, client=client_label(client_id))
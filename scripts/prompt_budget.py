@@ -0,0 +1,104 @@
+import math
+import re
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken est optionnel : on retombe sur une estimation
+    tiktoken = None
+
+# Surcoût approximatif en tokens de l'en-tête "[Passage n (modifié le ...)]: " de build_prompt
+PASSAGE_OVERHEAD_TOKENS = 12
+# Au-delà de cette similarité (Jaccard sur des triplets de mots), un passage est considéré comme doublon
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_encodings = {}
+
+
+def _encoding(model):
+    """
+    Encodage tiktoken du modèle, ou None s'il ne peut pas être chargé : les fichiers BPE sont
+    téléchargés au premier usage (réseau, cache disque) ; l'échec est mémorisé pour le processus.
+    """
+    if model not in _encodings:
+        try:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"⚠️  Encodage tiktoken indisponible pour {model}, estimation à ~4 caractères par token : {e}")
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def count_tokens(text, model):
+    """Nombre de tokens d'un texte (tiktoken si disponible, sinon ~4 caractères par token)"""
+    encoding = _encoding(model) if tiktoken is not None else None
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def _chunk_index(context):
+    try:
+        return int(context.get("id"))
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_adjacent_chunks(contexts):
+    """Fusionne les chunks consécutifs d'une même URL, à la position du plus pertinent"""
+    merged = []
+    for context in contexts:
+        index = _chunk_index(context)
+        target = None
+        if index is not None and context.get("url"):
+            for candidate in merged:
+                if candidate["url"] == context["url"] and (
+                    index == candidate["first"] - 1 or index == candidate["last"] + 1
+                ):
+                    target = candidate
+                    break
+        if target is None:
+            merged.append({**context, "first": index, "last": index})
+        elif index < target["first"]:
+            target["content"] = context["content"] + "\n" + target["content"]
+            target["first"] = index
+        else:
+            target["content"] = target["content"] + "\n" + context["content"]
+            target["last"] = index
+    for context in merged:
+        del context["first"], context["last"]
+    return merged
+
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < 3:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def assemble_contexts(contexts, token_budget, model):
+    """
+    Sélectionne les passages (dans l'ordre de pertinence) qui tiennent dans le budget de tokens,
+    après fusion des chunks adjacents et suppression des quasi-doublons.
+    Retourne (passages retenus, nombre de tokens utilisés).
+    """
+    selected, kept_shingles = [], []
+    used = 0
+    for context in merge_adjacent_chunks(contexts):
+        shingles = _shingles(context["content"])
+        if any(
+            len(shingles & other) / len(shingles | other) >= NEAR_DUPLICATE_THRESHOLD
+            for other in kept_shingles
+        ):
+            continue
+        tokens = count_tokens(context["content"], model) + PASSAGE_OVERHEAD_TOKENS
+        if used + tokens > token_budget:
+            # Un passage plus court, moins pertinent, peut encore tenir dans le budget
+            continue
+        selected.append(context)
+        kept_shingles.append(shingles)
+        used += tokens
+    return selected, used
@@ -0,0 +1,149 @@
+"""
+Fournisseurs de modèles (embeddings et complétions).
+
+- "openai" : l'API OpenAI (par défaut)
+- "local" : substitut hors ligne et déterministe, pour les tests de charge, le profilage et les
+  benchmarks sans appel à l'API. Embeddings par hachage des mots et trigrammes (des textes proches
+  donnent des vecteurs proches), latence simulée et réponses types envoyées mot par mot.
+
+Sélection par "provider" dans le config.json du client ou par la variable CHATBOT_PROVIDER.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+
+import numpy as np
+import openai
+
+DEFAULT_PROVIDER = os.environ.get("CHATBOT_PROVIDER", "openai")
+
+# Latences simulées par le fournisseur local (millisecondes)
+LOCAL_EMBEDDING_LATENCY_MS = float(os.environ.get("CHATBOT_LOCAL_EMBEDDING_LATENCY_MS", "0"))
+LOCAL_CHAT_LATENCY_MS = float(os.environ.get("CHATBOT_LOCAL_CHAT_LATENCY_MS", "0"))
+LOCAL_TOKEN_LATENCY_MS = float(os.environ.get("CHATBOT_LOCAL_TOKEN_LATENCY_MS", "0"))
+
+# Dimension native des modèles d'embeddings
+MODEL_DIMENSIONS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
+
+
+def _timeout_option(timeout):
+    # timeout=None désactiverait le délai par défaut du SDK : on ne le transmet que s'il est défini
+    return {"timeout": timeout} if timeout is not None else {}
+
+
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self):
+        self._async_client = None
+
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = openai.AsyncOpenAI(api_key=openai.api_key, max_retries=0)
+        return self._async_client
+
+    def embed(self, texts, model, timeout=None, **options):
+        response = openai.embeddings.create(input=texts, model=model, **_timeout_option(timeout), **options)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def complete(self, messages, model, temperature, max_tokens, timeout=None):
+        response = openai.chat.completions.create(
+            model=model, messages=messages, temperature=temperature,
+            max_tokens=max_tokens, **_timeout_option(timeout)
+        )
+        return response.choices[0].message.content
+
+    def stream(self, messages, model, temperature, max_tokens, timeout=None):
+        stream = openai.chat.completions.create(
+            model=model, messages=messages, temperature=temperature,
+            max_tokens=max_tokens, stream=True, **_timeout_option(timeout)
+        )
+        return (
+            chunk.choices[0].delta.content
+            for chunk in stream
+            if chunk.choices and chunk.choices[0].delta.content
+        )
+
+    async def embed_async(self, texts, model, timeout=None, **options):
+        response = await self.async_client().embeddings.create(input=texts, model=model, **_timeout_option(timeout), **options)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def complete_async(self, messages, model, temperature, max_tokens, timeout=None):
+        response = await self.async_client().chat.completions.create(
+            model=model, messages=messages, temperature=temperature,
+            max_tokens=max_tokens, **_timeout_option(timeout)
+        )
+        return response.choices[0].message.content
+
+
+class LocalProvider:
+    name = "local"
+
+    def _features(self, text):
+        text = text.lower()
+        words = re.findall(r"\w+", text)
+        grams = [text[i:i + 3] for i in range(max(0, len(text) - 2))]
+        return words + grams
+
+    def embedding(self, text, dimensions):
+        vector = np.zeros(dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % dimensions] += 1.0 if (value >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed(self, texts, model, timeout=None, dimensions=None):
+        time.sleep(LOCAL_EMBEDDING_LATENCY_MS / 1000)
+        dimensions = dimensions or MODEL_DIMENSIONS.get(model, 1536)
+        return [self.embedding(text, dimensions) for text in texts]
+
+    def answer(self, messages):
+        question = re.findall(r"Question : (.*)", messages[-1]["content"])
+        question = question[-1] if question else messages[-1]["content"][:80]
+        return f"Réponse simulée à « {question.strip()} » : merci pour votre question, notre équipe vous répond avec plaisir. 😊"
+
+    def complete(self, messages, model, temperature, max_tokens, timeout=None):
+        time.sleep(LOCAL_CHAT_LATENCY_MS / 1000)
+        return self.answer(messages)
+
+    def stream(self, messages, model, temperature, max_tokens, timeout=None):
+        time.sleep(LOCAL_CHAT_LATENCY_MS / 1000)
+        words = self.answer(messages).split(" ")
+
+        def deltas():
+            for i, word in enumerate(words):
+                time.sleep(LOCAL_TOKEN_LATENCY_MS / 1000)
+                yield word if i == 0 else " " + word
+        return deltas()
+
+    async def embed_async(self, texts, model, timeout=None, dimensions=None):
+        await asyncio.sleep(LOCAL_EMBEDDING_LATENCY_MS / 1000)
+        dimensions = dimensions or MODEL_DIMENSIONS.get(model, 1536)
+        return [self.embedding(text, dimensions) for text in texts]
+
+    async def complete_async(self, messages, model, temperature, max_tokens, timeout=None):
+        await asyncio.sleep(LOCAL_CHAT_LATENCY_MS / 1000)
+        return self.answer(messages)
+
+
+PROVIDERS = {
+    "openai": OpenAIProvider(),
+    "local": LocalProvider(),
+}
+
+
+def get_provider(name=None):
+    name = name or DEFAULT_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Fournisseur de modèles inconnu : {name}")
+    return PROVIDERS[name]
@@ -0,0 +1,177 @@
+"""
+Regroupement des questions similaires pour /questions_frequent.
+
+Même critère que la double boucle d'origine (SequenceMatcher, ratio > 0.7, regroupement glouton
+dans l'ordre des questions), sans comparer toutes les paires : seules les questions partageant
+assez de trigrammes de caractères (indice de Dice >= CANDIDATE_DICE) sont comparées avec
+SequenceMatcher. Les candidats sont trouvés par filtrage par préfixe (les trigrammes les plus
+rares de chaque question sont indexés) et les doublons exacts ne sont comparés qu'une fois.
+
+Le regroupement est approché : le filtre de Dice n'est pas une borne du ratio, et des questions
+courtes avec plusieurs fautes peuvent dépasser 0.7 sans partager assez de trigrammes (ex.
+"comment mairie" / "commbnt dbdrie" : ratio 0.714, non regroupées). bench_clusters.py mesure
+l'écart avec la double boucle (99.9 % des questions dans le même groupe sur 3000 questions
+synthétiques bruitées, mêmes effectifs des 10 premiers groupes).
+
+Le coût (~0.5 ms par question) rend le calcul trop long pour être refait à chaque appel : le
+résultat est gardé par (client, période) dans `frequent_results` tant que question_stats.py n'a pas
+compté de nouvelles entrées, et seules les CHATBOT_FREQUENT_MAX_QUESTIONS questions les plus
+récentes sont regroupées.
+
+Mesure : python bench_clusters.py
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from difflib import SequenceMatcher
+
+MIN_SIMILARITY = 0.7
+# Seuil des candidats : en dessous, deux questions atteignent rarement un ratio de 0.7 (pas une borne)
+CANDIDATE_DICE = 0.4
+# Questions regroupées au plus par /questions_frequent (les plus récentes)
+MAX_QUESTIONS = int(os.environ.get("CHATBOT_FREQUENT_MAX_QUESTIONS", "10000"))
+# Résultats gardés en mémoire (client, période)
+RESULT_CACHE_SIZE = 64
+
+# Mots-clés de /questions_frequent : stopwords FR/EN exclus, mots > 3 lettres
+STOPWORDS = set([
+    'le','la','les','un','une','des','du','de','d','en','et','ou','a','au','aux','pour','par','sur','avec','sans','dans','ce','cette','ces','mon','ma','mes','ton','ta','tes','son','sa','ses','notre','nos','votre','vos','leur','leurs','je','tu','il','elle','on','nous','vous','ils','elles','y','est','suis','es','sont','êtes','été','être','ai','as','avons','avez','ont','avoir','fait','fais','faisons','faites','font','faire','plus','moins','très','peu','beaucoup','comment','quoi','quel','quelle','quels','quelles','qui','que','qu','où','quand','donc','si','là','ça','c','se','sa','aujourd','hui','the','and','or','but','for','not','are','is','was','were','be','been','being','have','has','had','do','does','did','of','to','in','on','at','by','with','from','as','an','it','this','that','these','those','i','you','he','she','we','they','my','your','his','her','its','our','their','me','him','them','us','can','will','just','so','if','then','than','too','very','all','any','some','no','nor','also','because','about','into','over','after','before','such','why','how','which','what','who','whom','where','when','again','once','here','there','each','own','same','other','more','most','own','same','other','more','most','s','t','d','ll','m','o','re','ve','y','ain','aren','couldn','didn','doesn','hadn','hasn','haven','isn','ma','mightn','mustn','needn','shan','shouldn','wasn','weren','won','wouldn'
+])
+
+
+def question_words(question):
+    """Mots-clés d'une question (nettoyage basique)"""
+    cleaned = re.sub(r"[^\w\s]", " ", question.lower())
+    return [word for word in cleaned.split() if len(word) > 3 and word not in STOPWORDS]
+
+
+def top_keywords(word_counts, top=15):
+    """[{"word", "count"}] des `top` mots les plus fréquents ({mot: nombre})"""
+    return [{"word": word, "count": count} for word, count in Counter(word_counts).most_common(top)]
+
+
+def trigrams(text):
+    if len(text) < 3:
+        return {text}
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _min_overlap(size, threshold):
+    """Trigrammes communs minimum avec une question quelconque pour atteindre le seuil de Dice"""
+    return max(1, math.ceil(threshold * size / (2 - threshold)))
+
+
+class CandidateIndex:
+    """Index des préfixes (trigrammes rares d'abord) des questions distinctes"""
+
+    def __init__(self, texts, threshold=CANDIDATE_DICE):
+        self.threshold = threshold
+        self.grams = [trigrams(text) for text in texts]
+        frequency = defaultdict(int)
+        for grams in self.grams:
+            for gram in grams:
+                frequency[gram] += 1
+        self.prefixes = []
+        self.index = defaultdict(list)
+        for position, grams in enumerate(self.grams):
+            ordered = sorted(grams, key=lambda gram: (frequency[gram], gram))
+            prefix = ordered[:len(ordered) - _min_overlap(len(ordered), threshold) + 1]
+            self.prefixes.append(prefix)
+            for gram in prefix:
+                self.index[gram].append(position)
+
+    def candidates(self, position):
+        """Questions distinctes dont l'indice de Dice avec `position` peut dépasser le seuil"""
+        grams = self.grams[position]
+        seen = set()
+        result = []
+        for gram in self.prefixes[position]:
+            for other in self.index[gram]:
+                if other in seen:
+                    continue
+                seen.add(other)
+                other_grams = self.grams[other]
+                if 2 * len(grams & other_grams) >= self.threshold * (len(grams) + len(other_grams)):
+                    result.append(other)
+        return result
+
+
+def group_similar_questions(questions, min_similarity=MIN_SIMILARITY, top=10):
+    """
+    [{"question", "count", "similar"}] des `top` groupes les plus fréquents, comme la double
+    boucle d'origine : chaque question non encore regroupée ouvre un groupe avec les questions
+    suivantes non regroupées dont le ratio dépasse min_similarity, parmi les candidats de l'index
+    (regroupement approché, cf. en-tête du module).
+    """
+    lowered = [question.lower() for question in questions]
+    # Questions identiques (après passage en minuscules) : une seule entrée dans l'index
+    distinct = {}
+    occurrences = []
+    for i, text in enumerate(lowered):
+        position = distinct.setdefault(text, len(distinct))
+        if position == len(occurrences):
+            occurrences.append([])
+        occurrences[position].append(i)
+    texts = list(distinct)
+    index = CandidateIndex(texts)
+    # Une question distincte est regroupée d'un bloc : toutes ses occurrences rejoignent le même groupe
+    grouped = [False] * len(texts)
+
+    question_groups = []
+    for i, q1 in enumerate(questions):
+        position = distinct[lowered[i]]
+        if grouped[position]:
+            continue
+        grouped[position] = True
+        members = occurrences[position][1:]
+        for other in index.candidates(position):
+            if grouped[other]:
+                continue
+            a, b = lowered[i], texts[other]
+            # Borne sur les longueurs (real_quick_ratio) avant le calcul exact
+            if 2 * min(len(a), len(b)) <= min_similarity * (len(a) + len(b)):
+                continue
+            if SequenceMatcher(None, a, b).ratio() > min_similarity:
+                grouped[other] = True
+                members.extend(occurrences[other])
+        members.sort()
+        question_groups.append({
+            "question": q1,
+            "count": 1 + len(members),
+            "similar": [questions[j] for j in members]
+        })
+    # Trier par nombre d'occurrences
+    return sorted(question_groups, key=lambda x: x["count"], reverse=True)[:top]
+
+
+class ResultCache:
+    """Résultats par clé, valables tant que la version des données (ex. compteurs de question_stats) est la même"""
+
+    def __init__(self, size=RESULT_CACHE_SIZE):
+        self.size = size
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        if version is None:
+            return None
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is None or cached[0] != version:
+                return None
+            self._results.move_to_end(key)
+            return cached[1]
+
+    def put(self, key, version, result):
+        if version is None:
+            return
+        with self._lock:
+            self._results[key] = (version, result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+
+frequent_results = ResultCache()
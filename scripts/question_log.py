@@ -0,0 +1,424 @@
+"""
+Journal des questions par client et par mois, au format JSON Lines (une entrée par ligne) :
+
+    clients/<client_id>/questions_logs/2025/07/2025-07.jsonl
+
+Les entrées sont ajoutées en fin de fichier par un thread d'écriture qui regroupe les questions
+en lots (aucune réécriture du mois à chaque /ask). Les anciens fichiers 2025-07.json (tableau
+JSON) et les mois clos compressés par log_maintenance.py (2025-07.jsonl.gz) restent lisibles :
+read_month fusionne les trois formats.
+
+Réglages par variables d'environnement :
+- CHATBOT_LOG_ASYNC : "0" pour écrire chaque entrée immédiatement, dans la requête
+- CHATBOT_LOG_FLUSH_INTERVAL : attente maximale (s) avant l'écriture d'un lot
+- CHATBOT_LOG_BATCH_SIZE : taille maximale d'un lot
+- CHATBOT_LOG_QUEUE_SIZE : entrées en attente au-delà desquelles l'écriture redevient synchrone
+- CHATBOT_LOG_FSYNC : "batch" (fsync après chaque lot) ou "none" (écriture laissée au système)
+
+Migration des anciens mois :
+    python question_log.py migrate [client_id ...] [--dry-run]
+"""
+import argparse
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from shared_files import file_lock
+
+CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
+LOG_ASYNC = os.environ.get("CHATBOT_LOG_ASYNC", "1") != "0"
+FLUSH_INTERVAL_S = float(os.environ.get("CHATBOT_LOG_FLUSH_INTERVAL", "0.5"))
+BATCH_SIZE = int(os.environ.get("CHATBOT_LOG_BATCH_SIZE", "500"))
+QUEUE_SIZE = int(os.environ.get("CHATBOT_LOG_QUEUE_SIZE", "10000"))
+FSYNC = os.environ.get("CHATBOT_LOG_FSYNC", "batch")
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def logs_base_dir(client_id):
+    return CLIENTS_PATH / client_id / "questions_logs"
+
+
+def legacy_path(client_id, year, month):
+    return logs_base_dir(client_id) / year / month / f"{year}-{month}.json"
+
+
+def jsonl_path(client_id, year, month):
+    return logs_base_dir(client_id) / year / month / f"{year}-{month}.jsonl"
+
+
+def archive_path(client_id, year, month):
+    return logs_base_dir(client_id) / year / month / f"{year}-{month}.jsonl.gz"
+
+
+def month_log_path(client_id, year, month):
+    """Fichier du mois à afficher : JSONL s'il existe, sinon l'archive ou l'ancien format s'ils existent"""
+    path = jsonl_path(client_id, year, month)
+    if path.exists():
+        return path
+    for other in (archive_path(client_id, year, month), legacy_path(client_id, year, month)):
+        if other.exists():
+            return other
+    return path
+
+
+def has_month(client_id, year, month):
+    return any(
+        path(client_id, year, month).exists() for path in (jsonl_path, archive_path, legacy_path)
+    )
+
+
+def list_months(client_id):
+    """[(année, mois)] des mois ayant un journal, du plus ancien au plus récent"""
+    base_dir = logs_base_dir(client_id)
+    if not base_dir.exists():
+        return []
+    months = []
+    for year_dir in base_dir.iterdir():
+        if not year_dir.is_dir():
+            continue
+        for month_dir in year_dir.iterdir():
+            if month_dir.is_dir() and has_month(client_id, year_dir.name, month_dir.name):
+                months.append((year_dir.name, month_dir.name))
+    return sorted(months)
+
+
+def read_jsonl(path):
+    entries = []
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Dernière ligne en cours d'écriture par un autre processus
+                continue
+    return entries
+
+
+def read_legacy(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_month(client_id, year, month):
+    """Entrées du mois dans l'ordre d'écriture : ancien fichier JSON, archive puis JSONL"""
+    entries = []
+    legacy = legacy_path(client_id, year, month)
+    if legacy.exists():
+        entries.extend(read_legacy(legacy))
+    archive = archive_path(client_id, year, month)
+    if archive.exists():
+        entries.extend(read_jsonl(archive))
+    path = jsonl_path(client_id, year, month)
+    if path.exists():
+        entries.extend(read_jsonl(path))
+    return entries
+
+
+def _reverse_lines(path, end):
+    """(position de début, ligne) des lignes situées avant `end`, de la dernière à la première"""
+    with open(path, "rb") as f:
+        position = end
+        head = b""
+        while position > 0:
+            size = min(READ_BLOCK_SIZE, position)
+            position -= size
+            f.seek(position)
+            chunk = f.read(size) + head
+            lines = chunk.split(b"\n")
+            head = lines[0]
+            line_end = position + len(chunk)
+            for line in reversed(lines[1:]):
+                line_start = line_end - len(line)
+                yield line_start, line
+                line_end = line_start - 1
+        if head:
+            yield 0, head
+
+
+# Sources des curseurs de pagination ("source:position") : fichiers du mois (read_page) ou analytics_store
+CURSOR_SOURCES = ("jsonl", "archive", "legacy", "store")
+
+
+def parse_cursor(cursor):
+    """(source, position) d'un next_cursor, quel que soit le moteur qui l'a produit ; ValueError si invalide"""
+    source, _, position = cursor.partition(":")
+    if source not in CURSOR_SOURCES or not position.isdigit():
+        raise ValueError(f"Curseur invalide : {cursor}")
+    return source, int(position)
+
+
+def cursor_entry(client_id, year, month, source, position):
+    """
+    Entrée désignée par un curseur de fichier (la dernière de la page précédente), pour reprendre
+    la pagination dans analytics_store ; None si elle n'existe plus (mois compressé entre-temps)
+    """
+    if source == "jsonl":
+        path = jsonl_path(client_id, year, month)
+        if not path.exists():
+            return None
+        with open(path, "rb") as f:
+            f.seek(position)
+            line = f.readline()
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+    path, read = (archive_path(client_id, year, month), read_jsonl) if source == "archive" else \
+        (legacy_path(client_id, year, month), read_legacy)
+    if not path.exists():
+        return None
+    logs = read(path)
+    return logs[position] if position < len(logs) else None
+
+
+def read_page(client_id, year, month, limit, offset=0, cursor=None):
+    """
+    Entrées du mois des plus récentes aux plus anciennes, en lisant le JSONL depuis la fin :
+    le coût dépend de offset + limit, pas du volume du mois. `cursor` (retourné par la page
+    précédente) reprend la lecture là où elle s'est arrêtée, sans `offset`.
+    Les mois clos (archive gzip, ancien JSON) ne se lisent pas à rebours : ils sont décompressés
+    en entier, puis parcourus depuis la fin.
+    Retourne (entrées, curseur de la page suivante ou None s'il n'y a plus d'entrées).
+    ValueError si le curseur a expiré (mois compressé entre deux pages) : recommencer sans curseur.
+    """
+    if limit < 1 or offset < 0:
+        raise ValueError("limit doit être >= 1 et offset >= 0")
+    sources = ("jsonl", "archive", "legacy")
+    path = jsonl_path(client_id, year, month)
+    source, position = parse_cursor(cursor) if cursor else ("jsonl", None)
+    if source not in sources:
+        # Curseur d'analytics_store (client servi par la base puis revenu aux fichiers)
+        raise ValueError(f"Curseur d'une autre source de données : {cursor}")
+    skip = 0 if cursor else offset
+    entries = []
+
+    if source == "jsonl":
+        if position is not None and (not path.exists() or position > path.stat().st_size):
+            # JSONL compressé (log_maintenance.py) ou remplacé depuis la page précédente : la position
+            # en octets ne désigne plus la même ligne, reprendre depuis l'archive renverrait des doublons
+            raise ValueError(f"Curseur expiré : {cursor}")
+        if path.exists():
+            last_start = position
+            for start, line in _reverse_lines(path, position if position is not None else path.stat().st_size):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Ligne vide ou en cours d'écriture
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                if len(entries) >= limit:
+                    return entries, f"jsonl:{last_start}"
+                entries.append(entry)
+                last_start = start
+        position = None
+
+    # Puis l'archive du mois, et l'ancien fichier JSON (non migré) qui contient les plus anciennes
+    for name, other_path, read in (
+        ("archive", archive_path(client_id, year, month), read_jsonl),
+        ("legacy", legacy_path(client_id, year, month), read_legacy),
+    ):
+        if sources.index(name) < sources.index(source):
+            continue
+        if other_path.exists():
+            logs = read(other_path)
+            index = len(logs) if position is None else position
+            index -= skip
+            skip = max(0, -index)
+            while index > 0:
+                if len(entries) >= limit:
+                    return entries, f"{name}:{index}"
+                index -= 1
+                entries.append(logs[index])
+        position = None
+    return entries, None
+
+
+def count_entries(client_id, year, month):
+    """Nombre d'entrées du mois (lignes comptées par blocs, sans décoder le JSONL)"""
+    total = 0
+    legacy = legacy_path(client_id, year, month)
+    if legacy.exists():
+        total += len(read_legacy(legacy))
+    for path, opener in ((archive_path(client_id, year, month), gzip.open), (jsonl_path(client_id, year, month), open)):
+        if path.exists():
+            with opener(path, "rb") as f:
+                for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+                    total += block.count(b"\n")
+    return total
+
+
+def _line(entry):
+    return json.dumps(entry, ensure_ascii=False) + "\n"
+
+
+def append_lines(path, lines, fsync=FSYNC == "batch"):
+    """Ajoute des lignes en fin de fichier, sous verrou (plusieurs workers écrivent le même mois)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(path):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+
+
+class QuestionLogWriter:
+    """File d'attente en mémoire vidée par lots par un thread d'écriture (un par processus)"""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL_S, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        # Fonctions (client_id, entrées, vecteurs) appelées après chaque écriture, ex. analytics_store.insert ;
+        # vecteurs : embedding de chaque question (None si non calculé), jamais écrit dans le JSONL
+        self.sinks = []
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._thread = None
+        self.counters = {"queued": 0, "written": 0, "batches": 0, "sync_writes": 0, "errors": 0}
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="question-log", daemon=True)
+                self._thread.start()
+
+    def append(self, client_id, entry, timestamp, vector=None):
+        """`timestamp` (datetime) détermine le fichier du mois ; `vector` est transmis aux sinks seulement"""
+        path = jsonl_path(client_id, timestamp.strftime("%Y"), timestamp.strftime("%m"))
+        if not LOG_ASYNC:
+            self._write_sync(client_id, path, entry, vector)
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((client_id, path, entry, vector))
+            self.counters["queued"] += 1
+        except queue.Full:
+            # Écriture plus lente que le trafic : on écrit dans la requête plutôt que de perdre l'entrée
+            self._write_sync(client_id, path, entry, vector)
+
+    def _write_sync(self, client_id, path, entry, vector):
+        append_lines(path, [_line(entry)])
+        self.counters["sync_writes"] += 1
+        self._notify(client_id, [entry], [vector])
+
+    def _notify(self, client_id, entries, vectors):
+        for sink in self.sinks:
+            try:
+                sink(client_id, entries, vectors)
+            except Exception as e:
+                self.counters["errors"] += 1
+                print(f"Erreur lors de la copie du journal des questions ({client_id}) : {e}")
+
+    def flush(self):
+        """Attend l'écriture de toutes les entrées en file"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                self.counters["errors"] += 1
+                print(f"Erreur lors de l'écriture du journal des questions : {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        by_path = {}
+        for client_id, path, entry, vector in batch:
+            by_path.setdefault((client_id, path), []).append((entry, vector))
+        for (client_id, path), items in by_path.items():
+            entries = [entry for entry, _ in items]
+            append_lines(path, [_line(entry) for entry in entries])
+            self._notify(client_id, entries, [vector for _, vector in items])
+        self.counters["written"] += len(batch)
+        self.counters["batches"] += 1
+
+
+# Écrivain partagé par tout le processus
+question_log = QuestionLogWriter()
+# Après un fork, le thread d'écriture n'existe plus : le worker repart d'une file vide
+os.register_at_fork(after_in_child=question_log._reset)
+atexit.register(question_log.flush)
+
+
+def migrate_month(client_id, year, month, dry_run=False):
+    """Convertit l'ancien fichier JSON du mois en JSONL (les entrées JSONL existantes sont conservées après)"""
+    legacy = legacy_path(client_id, year, month)
+    path = jsonl_path(client_id, year, month)
+    with file_lock(path):
+        with open(legacy, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        if dry_run:
+            return len(entries)
+        tmp_path = path.with_suffix(".jsonl.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(_line(entry) for entry in entries)
+            if path.exists():
+                with open(path, "r", encoding="utf-8") as current:
+                    f.write(current.read())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        legacy.unlink()
+    return len(entries)
+
+
+def migrate(client_ids=None, dry_run=False):
+    if not client_ids:
+        client_ids = sorted(d.name for d in CLIENTS_PATH.iterdir() if d.is_dir()) if CLIENTS_PATH.exists() else []
+    total = 0
+    for client_id in client_ids:
+        for year, month in list_months(client_id):
+            if not legacy_path(client_id, year, month).exists():
+                continue
+            try:
+                count = migrate_month(client_id, year, month, dry_run)
+            except (OSError, ValueError) as e:
+                print(f"❌ {client_id} {year}-{month} : {e}")
+                continue
+            total += count
+            print(f"{'(simulation) ' if dry_run else ''}✅ {client_id} {year}-{month} : {count} questions")
+    print(f"{total} questions {'à migrer' if dry_run else 'migrées'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Convertit les mois au format JSON en JSONL")
+    migrate_parser.add_argument("client_ids", nargs="*", help="Clients à migrer (tous par défaut)")
+    migrate_parser.add_argument("--dry-run", action="store_true", help="Compte les questions sans rien modifier")
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrate(args.client_ids, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
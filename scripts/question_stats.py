@@ -0,0 +1,190 @@
+"""
+Statistiques des questions tenues à jour à l'écriture, dans un petit fichier par client :
+
+    clients/<client_id>/questions_logs/stats.json
+
+Compteurs par jour et par mois, total, première et dernière question, ainsi que l'inode et la
+position (en octets) jusqu'à laquelle chaque fichier JSONL a été compté. Chaque lot écrit par
+question_log.py déclenche la lecture de la fin des fichiers concernés uniquement : la mise à
+jour est idempotente, quel que soit le worker qui l'exécute. /questions_stats lit ce fichier
+sans parcourir l'historique.
+
+Sans fichier (client existant avant son introduction, mois supprimé ou migré), tout l'historique
+est recompté à la prochaine écriture ou lecture. Recalcul manuel :
+    python question_stats.py rebuild [client_id ...]
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+from question_log import archive_path, jsonl_path, legacy_path, list_months, logs_base_dir, question_log, read_jsonl
+from shared_files import file_lock, write_json_atomic
+
+CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
+
+
+def stats_path(client_id):
+    return logs_base_dir(client_id) / "stats.json"
+
+
+def empty_stats():
+    return {"total": 0, "first": None, "last": None, "by_month": {}, "by_day": {}, "offsets": {}, "legacy": []}
+
+
+def _count(stats, entries):
+    for entry in entries:
+        timestamp = entry.get("timestamp")
+        if not timestamp:
+            continue
+        stats["total"] += 1
+        stats["by_month"][timestamp[:7]] = stats["by_month"].get(timestamp[:7], 0) + 1
+        stats["by_day"][timestamp[:10]] = stats["by_day"].get(timestamp[:10], 0) + 1
+        if stats["first"] is None or timestamp < stats["first"]:
+            stats["first"] = timestamp
+        if stats["last"] is None or timestamp > stats["last"]:
+            stats["last"] = timestamp
+
+
+def _read_tail(path, offset):
+    """Entrées ajoutées après `offset` et nouvelle position (les lignes incomplètes sont laissées)"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    entries = []
+    for line in data[:end].splitlines():
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return entries, offset + end
+
+
+def load(client_id):
+    path = stats_path(client_id)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _catch_up(client_id, stats, months):
+    """Compte la fin des fichiers JSONL des mois donnés ; False si un fichier a été réécrit"""
+    base_dir = logs_base_dir(client_id)
+    for year, month in months:
+        legacy = legacy_path(client_id, year, month)
+        if str(legacy.relative_to(base_dir)) in stats["legacy"] and not legacy.exists():
+            # Ancien fichier converti en JSONL : ses entrées seraient comptées deux fois
+            return False
+        path = jsonl_path(client_id, year, month)
+        if not path.exists():
+            continue
+        key = str(path.relative_to(base_dir))
+        file_stat = path.stat()
+        inode, offset = stats["offsets"].get(key, (file_stat.st_ino, 0))
+        # Fichier remplacé (migration) ou tronqué : les positions enregistrées ne valent plus
+        if inode != file_stat.st_ino or file_stat.st_size < offset:
+            return False
+        entries, offset = _read_tail(path, offset)
+        stats["offsets"][key] = [inode, offset]
+        _count(stats, entries)
+    return True
+
+
+def _build(client_id):
+    stats = empty_stats()
+    for year, month in list_months(client_id):
+        # Les anciens fichiers JSON et les archives ne grandissent plus : comptés une fois pour toutes
+        legacy = legacy_path(client_id, year, month)
+        if legacy.exists():
+            with open(legacy, "r", encoding="utf-8") as f:
+                _count(stats, json.load(f))
+            stats["legacy"].append(str(legacy.relative_to(logs_base_dir(client_id))))
+        archive = archive_path(client_id, year, month)
+        if archive.exists():
+            _count(stats, read_jsonl(archive))
+        _catch_up(client_id, stats, [(year, month)])
+    return stats
+
+
+def refresh(client_id, months=None):
+    """
+    Met à jour (ou construit) les statistiques du client et les retourne.
+    `months` : mois [(année, mois)] ayant reçu de nouvelles entrées ; tous si None.
+    """
+    if not logs_base_dir(client_id).exists():
+        return empty_stats()
+    path = stats_path(client_id)
+    with file_lock(path):
+        stats = load(client_id)
+        if stats is None or not _catch_up(client_id, stats, months if months is not None else list_months(client_id)):
+            stats = _build(client_id)
+        write_json_atomic(path, stats)
+    return stats
+
+
+def invalidate(client_id):
+    """À appeler quand des mois sont supprimés ou réécrits : recalcul complet au prochain accès"""
+    path = stats_path(client_id)
+    with file_lock(path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def record(client_id, entries, vectors=None):
+    """Sink de question_log : compte les lignes écrites depuis la dernière mise à jour"""
+    months = sorted({(entry["timestamp"][:4], entry["timestamp"][5:7]) for entry in entries if entry.get("timestamp")})
+    refresh(client_id, months)
+
+
+question_log.sinks.append(record)
+
+
+def summary(stats, now=None):
+    """Réponse de /questions_stats"""
+    now = now or datetime.now()
+    if not stats["total"]:
+        return {
+            "total_questions": 0,
+            "questions_today": 0,
+            "questions_this_month": 0,
+            "first_question_date": None,
+            "last_question_date": None,
+            "questions_by_month": {}
+        }
+    return {
+        "total_questions": stats["total"],
+        "questions_today": stats["by_day"].get(now.strftime("%Y-%m-%d"), 0),
+        "questions_this_month": stats["by_month"].get(now.strftime("%Y-%m"), 0),
+        "first_question_date": stats["first"],
+        "last_question_date": stats["last"],
+        "questions_by_month": dict(sorted(stats["by_month"].items())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="Recompte tout l'historique des questions")
+    rebuild_parser.add_argument("client_ids", nargs="*", help="Clients à recalculer (tous par défaut)")
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        client_ids = args.client_ids or (
+            sorted(d.name for d in CLIENTS_PATH.iterdir() if d.is_dir()) if CLIENTS_PATH.exists() else []
+        )
+        for client_id in client_ids:
+            if logs_base_dir(client_id).exists():
+                invalidate(client_id)
+            stats = refresh(client_id)
+            print(f"✅ {client_id} : {stats['total']} questions")
+
+
+if __name__ == "__main__":
+    main()
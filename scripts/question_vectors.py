@@ -0,0 +1,339 @@
+"""
+Regroupement sémantique des questions posées, calculé au fil de l'eau pour /questions_frequent?mode=semantic.
+
+L'embedding de la question, calculé pour la réponse (chatbot_answer), accompagne l'entrée du log
+jusqu'aux sinks de question_log.py sans être écrit dans le JSONL : après chaque lot écrit, il est
+ajouté au fichier de vecteurs du mois (aucun appel à l'API) :
+
+    clients/<client_id>/questions_logs/2025/07/2025-07.vectors
+
+Chaque enregistrement contient la dimension, la question et le vecteur normalisé (float16).
+Les questions répondues par la recherche lexicale seule, sans embedding, n'y figurent pas.
+
+À l'appel de /questions_frequent?mode=semantic, chaque vecteur pas encore lu rejoint le groupe dont
+le centroïde est le plus proche (similarité cosinus >= CHATBOT_SEMANTIC_THRESHOLD) ou ouvre un nouveau
+groupe. Les groupes restent en mémoire dans le worker ; ceux du mois (2025-07.clusters.npz) et de tout
+l'historique (questions_logs/clusters.npz) sont enregistrés périodiquement avec les mots-clés des
+questions lues et la position déjà lue dans chaque fichier de vecteurs : la mise à jour est idempotente
+entre workers, et /questions_frequent?mode=semantic ne relit pas les logs.
+
+Réglages par variables d'environnement :
+- CHATBOT_SEMANTIC_CLUSTERS : "1" pour enregistrer les vecteurs et tenir les groupes à jour
+- CHATBOT_SEMANTIC_THRESHOLD : similarité minimale avec un centroïde pour rejoindre son groupe
+- CHATBOT_SEMANTIC_MAX_CLUSTERS : nombre maximal de groupes par fichier (1000 par défaut)
+
+Recalcul des groupes à partir des fichiers de vecteurs :
+    python question_vectors.py rebuild [client_id ...]
+"""
+import argparse
+import io
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from question_clusters import question_words
+from question_log import list_months, logs_base_dir, question_log
+from shared_files import file_lock
+
+CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
+SEMANTIC_ENABLED = os.environ.get("CHATBOT_SEMANTIC_CLUSTERS", "0") == "1"
+SIMILARITY_THRESHOLD = float(os.environ.get("CHATBOT_SEMANTIC_THRESHOLD", "0.75"))
+# Questions distinctes conservées par groupe (les suivantes ne font qu'augmenter le compteur)
+MEMBER_LIMIT = 20
+# Nombre maximal de groupes par fichier : au-delà, chaque question rejoint le groupe le plus proche
+MAX_CLUSTERS = int(os.environ.get("CHATBOT_SEMANTIC_MAX_CLUSTERS", "1000"))
+# Intervalle minimal entre deux écritures des groupes tenus en mémoire (secondes)
+SAVE_INTERVAL = 60
+# Fichiers de groupes (mois ou historique) gardés en mémoire par worker
+STATE_CACHE_SIZE = 16
+RECORD_HEADER = struct.Struct("<HI")  # dimension, longueur de la question en octets
+
+_states = {}  # chemin des groupes -> {"state", "saved", "lock"}, du moins au plus récemment utilisé
+_states_lock = threading.Lock()
+
+
+def vectors_path(client_id, year, month):
+    return logs_base_dir(client_id) / year / month / f"{year}-{month}.vectors"
+
+
+def clusters_path(client_id, period=None):
+    if period:
+        year, month = period.split("-")
+        return logs_base_dir(client_id) / year / month / f"{year}-{month}.clusters.npz"
+    return logs_base_dir(client_id) / "clusters.npz"
+
+
+# --- Fichiers de vecteurs ---
+
+def encode_record(question, vector):
+    text = question.encode("utf-8")
+    return RECORD_HEADER.pack(len(vector), len(text)) + text + vector.astype("<f2").tobytes()
+
+
+def read_records(path, offset):
+    """[(question, vecteur float32)] enregistrés après `offset`, et nouvelle position"""
+    with file_lock(path):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    records = []
+    position = 0
+    while position + RECORD_HEADER.size <= len(data):
+        dims, text_length = RECORD_HEADER.unpack_from(data, position)
+        end = position + RECORD_HEADER.size + text_length + 2 * dims
+        if end > len(data):
+            break
+        text_start = position + RECORD_HEADER.size
+        question = data[text_start:text_start + text_length].decode("utf-8")
+        vector = np.frombuffer(data, dtype="<f2", count=dims, offset=text_start + text_length).astype(np.float32)
+        records.append((question, vector))
+        position = end
+    return records, offset + position
+
+
+def append_vectors(client_id, year, month, records):
+    path = vectors_path(client_id, year, month)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(path):
+        with open(path, "ab") as f:
+            f.write(b"".join(encode_record(question, vector) for question, vector in records))
+
+
+# --- Groupes ---
+
+def empty_state():
+    return {"sums": None, "counts": [], "clusters": [], "keywords": {}, "offsets": {}}
+
+
+def load_state(path):
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            sums = data["sums"] if data["sums"].size else None
+    except (OSError, ValueError, KeyError):
+        return None
+    if "keywords" not in meta:
+        # Groupes enregistrés avant le suivi des mots-clés : recalculés depuis les fichiers de vecteurs
+        return None
+    meta["sums"] = sums
+    return meta
+
+
+def save_state(path, state):
+    meta = {key: value for key, value in state.items() if key != "sums"}
+    # `sums` a une capacité supérieure au nombre de groupes (voir assign) : seules les lignes utilisées sont écrites
+    sums = state["sums"][:len(state["counts"])] if state["sums"] is not None else np.zeros((0, 0), dtype=np.float32)
+    buffer = io.BytesIO()
+    np.savez(buffer, sums=sums, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(buffer.getvalue())
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def assign(state, records, threshold=SIMILARITY_THRESHOLD, max_clusters=MAX_CLUSTERS):
+    """
+    Ajoute chaque vecteur au groupe du centroïde le plus proche, ou ouvre un nouveau groupe.
+    Au-delà de `max_clusters` groupes, le vecteur rejoint le groupe le plus proche quel que soit le seuil.
+    """
+    sums = state["sums"]
+    centroids = None
+    keywords = state["keywords"]
+    for question, vector in records:
+        size = len(state["counts"])
+        if sums is not None and vector.shape[0] != sums.shape[1]:
+            # Vecteur d'un autre modèle d'embeddings (config modifiée) : non comparable
+            continue
+        for word in question_words(question):
+            keywords[word] = keywords.get(word, 0) + 1
+        best = None
+        if size:
+            if centroids is None:
+                centroids = np.zeros_like(sums)
+                centroids[:size] = sums[:size] / np.linalg.norm(sums[:size], axis=1, keepdims=True)
+            similarities = centroids[:size] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < threshold and size < max_clusters:
+                best = None
+        if best is None:
+            if sums is None or size == len(sums):
+                # Capacité doublée à chaque dépassement : ajout d'un groupe en temps amorti constant
+                grown = np.zeros((max(2 * size, 16), vector.shape[0]), dtype=np.float32)
+                if size:
+                    grown[:size] = sums[:size]
+                sums = grown
+                centroids = None
+            sums[size] = vector
+            if centroids is not None:
+                centroids[size] = vector
+            state["counts"].append(0)
+            state["clusters"].append({"question": question, "members": {}})
+            best = size
+        else:
+            sums[best] += vector
+            centroids[best] = sums[best] / np.linalg.norm(sums[best])
+        state["counts"][best] += 1
+        members = state["clusters"][best]["members"]
+        if question in members or len(members) < MEMBER_LIMIT:
+            members[question] = members.get(question, 0) + 1
+    state["sums"] = sums
+
+
+def catch_up(client_id, state, months):
+    """Groupe les vecteurs non encore lus des mois donnés ; False si un fichier a été remplacé"""
+    base_dir = logs_base_dir(client_id)
+    for year, month in months:
+        path = vectors_path(client_id, year, month)
+        if not path.exists():
+            continue
+        key = str(path.relative_to(base_dir))
+        file_stat = path.stat()
+        inode, offset = state["offsets"].get(key, (file_stat.st_ino, 0))
+        if inode != file_stat.st_ino or file_stat.st_size < offset:
+            return False
+        records, offset = read_records(path, offset)
+        state["offsets"][key] = [inode, offset]
+        assign(state, records)
+    return True
+
+
+def cached_entry(path):
+    """Groupes tenus en mémoire pour `path` (les moins récemment utilisés sont oubliés)"""
+    with _states_lock:
+        entry = _states.pop(str(path), None) or {"state": None, "saved": None, "lock": threading.RLock()}
+        _states[str(path)] = entry
+        while len(_states) > STATE_CACHE_SIZE:
+            _states.pop(next(iter(_states)))
+    return entry
+
+
+def refresh(client_id, period=None):
+    """
+    Groupes à jour du mois `period` (AAAA-MM), ou de tout l'historique. Les groupes restent en mémoire :
+    seuls les vecteurs ajoutés depuis l'appel précédent sont lus, et le fichier .clusters.npz n'est
+    réécrit (point de reprise pour les autres workers et les redémarrages) qu'au plus toutes les
+    SAVE_INTERVAL secondes.
+    """
+    if period:
+        months = [tuple(period.split("-"))]
+    else:
+        months = list_months(client_id)
+    path = clusters_path(client_id, period)
+    if not path.parent.exists():
+        return empty_state()
+    base_dir = logs_base_dir(client_id)
+    entry = cached_entry(path)
+    with entry["lock"]:
+        state = entry["state"]
+        if state is None:
+            with file_lock(path):
+                state = load_state(path)
+        total = sum(state["counts"]) if state is not None else None
+        # Mois supprimé par la rétention depuis la dernière mise à jour : recalcul complet
+        if state is not None and any(not (base_dir / key).exists() for key in state["offsets"]):
+            state = None
+        if state is None or not catch_up(client_id, state, months):
+            state = empty_state()
+            catch_up(client_id, state, months)
+            total = None
+        entry["state"] = state
+        changed = total != sum(state["counts"])
+        if changed and (entry["saved"] is None or time.monotonic() - entry["saved"] >= SAVE_INTERVAL):
+            with file_lock(path):
+                save_state(path, state)
+            entry["saved"] = time.monotonic()
+    return state
+
+
+def invalidate(client_id):
+    """Groupes de tout l'historique recalculés au prochain accès"""
+    path = clusters_path(client_id)
+    with file_lock(path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+    with _states_lock:
+        _states.pop(str(path), None)
+
+
+def record(client_id, entries, vectors=None):
+    """
+    Sink de question_log : enregistre les vecteurs des questions écrites. Les groupes ne sont mis à jour
+    qu'à la demande (frequent_questions), hors du thread d'écriture du log.
+    """
+    by_month = {}
+    for entry, embedding in zip(entries, vectors or []):
+        timestamp, question = entry.get("timestamp", ""), entry.get("question")
+        if not question or len(timestamp) < 7 or embedding is None:
+            continue
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            by_month.setdefault((timestamp[:4], timestamp[5:7]), []).append((question, vector / norm))
+    for (year, month), records in by_month.items():
+        append_vectors(client_id, year, month, records)
+
+
+if SEMANTIC_ENABLED:
+    question_log.sinks.append(record)
+
+
+def frequent_questions(client_id, period=None, top=10):
+    """
+    (groupes les plus fréquents au format de /questions_frequent, {mot-clé: nombre}) à partir
+    des groupes tenus à jour ; None si le regroupement sémantique est désactivé ou si aucun vecteur
+    n'a été enregistré pour le client (ou la période)
+    """
+    if not SEMANTIC_ENABLED or not logs_base_dir(client_id).exists():
+        return None
+    entry = cached_entry(clusters_path(client_id, period))
+    with entry["lock"]:
+        state = refresh(client_id, period)
+        if not state["counts"]:
+            return None
+        order = sorted(range(len(state["counts"])), key=lambda k: state["counts"][k], reverse=True)[:top]
+        groups = []
+        for k in order:
+            cluster = state["clusters"][k]
+            members = sorted(cluster["members"].items(), key=lambda item: item[1], reverse=True)
+            groups.append({
+                "question": cluster["question"],
+                "count": state["counts"][k],
+                "similar": [question for question, _ in members if question != cluster["question"]]
+            })
+        return groups, dict(state["keywords"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="Recalcule les groupes à partir des fichiers de vecteurs")
+    rebuild_parser.add_argument("client_ids", nargs="*", help="Clients à recalculer (tous par défaut)")
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        client_ids = args.client_ids or (
+            sorted(d.name for d in CLIENTS_PATH.iterdir() if d.is_dir()) if CLIENTS_PATH.exists() else []
+        )
+        for client_id in client_ids:
+            if not logs_base_dir(client_id).exists():
+                continue
+            for year, month in list_months(client_id):
+                clusters_path(client_id, f"{year}-{month}").unlink(missing_ok=True)
+                refresh(client_id, f"{year}-{month}")
+            invalidate(client_id)
+            state = refresh(client_id)
+            print(f"✅ {client_id} : {sum(state['counts'])} questions, {len(state['counts'])} groupes")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,16 +5,13 @@ import requests
 from bs4 import BeautifulSoup
 from pathlib import Path
 import re
+from client_config import load_client_config as shared_load_client_config
 
 # Chemin des clients, défini par la variable d'environnement CHATBOT_CLIENTS_PATH
 CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
 
 def load_client_config(client_id):
-    config_path = CLIENTS_PATH / client_id / "config.json"
-    if not config_path.is_file():
-        raise FileNotFoundError(f"Config client introuvable : {config_path}")
-    with open(config_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return shared_load_client_config(client_id, required=True)
 
 def clean_html(raw_html):
     soup = BeautifulSoup(raw_html, "html.parser")
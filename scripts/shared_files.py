@@ -0,0 +1,39 @@
+"""
+Écritures de fichiers partagés entre processus (workers de gunicorn.conf.py, scripts cron).
+
+- file_lock : verrou exclusif (flock) sur un fichier <chemin>.lock, pour les lecture-modification-écriture
+- write_json_atomic : écriture dans un fichier temporaire puis os.replace, pour que les lecteurs
+  voient l'ancien ou le nouveau contenu, jamais un fichier partiel
+"""
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def file_lock(path):
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def write_json_atomic(path, data, **dump_options):
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, **dump_options)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Regroupe les appels identiques simultanés : le premier appelant calcule le résultat,
+    les suivants attendent et le partagent. Rien n'est conservé une fois le calcul terminé.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counters = {"leaders": 0, "followers": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.counters["leaders"] += 1
+            else:
+                self.counters["followers"] += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class AsyncSingleFlight:
+    """Équivalent de SingleFlight pour les coroutines d'une même boucle asyncio"""
+
+    def __init__(self):
+        self._calls = {}
+        self.counters = {"leaders": 0, "followers": 0}
+
+    async def do(self, key, coroutine_fn):
+        future = self._calls.get(key)
+        if future is not None:
+            self.counters["followers"] += 1
+            # shield : l'annulation d'un appelant suiveur n'annule pas le calcul partagé
+            return await asyncio.shield(future)
+        self.counters["leaders"] += 1
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await coroutine_fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Évite l'avertissement "exception never retrieved" quand personne n'attendait
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
@@ -0,0 +1,260 @@
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Budget de latence des appels à l'API (secondes), réglable par variables d'environnement :
+# - CHATBOT_REQUEST_BUDGET : budget total d'une requête (embedding + complétion)
+# - CHATBOT_EMBEDDING_TIMEOUT : délai maximal d'un appel d'embeddings
+# - CHATBOT_EMBEDDING_HEDGE_DELAY : délai avant de lancer un second appel d'embeddings en parallèle
+# - CHATBOT_CHAT_TIMEOUT : délai maximal d'une complétion
+# - CHATBOT_BREAKER_FAILURES / CHATBOT_BREAKER_COOLDOWN : échecs consécutifs avant ouverture
+#   du disjoncteur d'un modèle, et durée pendant laquelle il reste ouvert
+REQUEST_BUDGET_S = float(os.environ.get("CHATBOT_REQUEST_BUDGET", "20"))
+EMBEDDING_TIMEOUT_S = float(os.environ.get("CHATBOT_EMBEDDING_TIMEOUT", "4"))
+EMBEDDING_HEDGE_DELAY_S = float(os.environ.get("CHATBOT_EMBEDDING_HEDGE_DELAY", "0.8"))
+CHAT_TIMEOUT_S = float(os.environ.get("CHATBOT_CHAT_TIMEOUT", "15"))
+BREAKER_FAILURES = int(os.environ.get("CHATBOT_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_S = float(os.environ.get("CHATBOT_BREAKER_COOLDOWN", "30"))
+
+# Réponse renvoyée quand l'API est indisponible (surchargeable par "fallback_answer" dans config.json)
+FALLBACK_ANSWER = (
+    "Désolé, je ne peux pas répondre pour le moment. "
+    "Merci de réessayer dans quelques instants. 🙏"
+)
+
+
+class UpstreamError(Exception):
+    """Appel à l'API impossible (délai dépassé, erreur, disjoncteur ouvert)"""
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class Deadline:
+    """Budget de temps restant pour une requête"""
+
+    def __init__(self, budget=REQUEST_BUDGET_S):
+        self.expires = time.monotonic() + budget
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def timeout(self, limit):
+        """Délai à accorder à un appel : le plus petit entre sa limite propre et le budget restant"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise UpstreamError("Budget de latence de la requête épuisé")
+        return min(limit, remaining)
+
+
+class CircuitBreaker:
+    """Disjoncteur par modèle : s'ouvre après N échecs consécutifs, puis laisse passer un essai"""
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN_S):
+        self.failures_threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Demi-ouverture : un appel d'essai, le disjoncteur se rouvre s'il échoue
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failures_threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        return "open" if self.opened_at is not None else "closed"
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_counters = Counter()
+_counters_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upstream")
+
+
+def _after_fork():
+    # Les threads du pool ne survivent pas à un fork : chaque worker crée le sien
+    global _pool
+    _pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upstream")
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def get_breaker(model):
+    with _breakers_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker()
+        return _breakers[model]
+
+
+def count(kind, model, outcome):
+    with _counters_lock:
+        _counters[(kind, model, outcome)] += 1
+
+
+def snapshot():
+    with _counters_lock:
+        counters = [
+            {"kind": kind, "model": model, "outcome": outcome, "count": n}
+            for (kind, model, outcome), n in sorted(_counters.items())
+        ]
+    with _breakers_lock:
+        breakers = {model: breaker.state for model, breaker in _breakers.items()}
+    return {"counters": counters, "breakers": breakers}
+
+
+def _guarded(kind, model):
+    breaker = get_breaker(model)
+    if not breaker.allow():
+        count(kind, model, "circuit_open")
+        raise CircuitOpenError(f"Disjoncteur ouvert pour {model}")
+    return breaker
+
+
+def _record(kind, model, breaker, error):
+    if error is None:
+        breaker.record_success()
+        count(kind, model, "success")
+        return
+    breaker.record_failure()
+    count(kind, model, "timeout" if isinstance(error, TimeoutError) or "timed out" in str(error).lower() else "error")
+
+
+def call_embedding(model, fn, deadline=None):
+    """
+    Appel d'embeddings borné dans le temps, avec hedging : si le premier appel n'a pas répondu
+    (ou a échoué) après EMBEDDING_HEDGE_DELAY_S, un second est lancé et le premier résultat gagne.
+    `fn(timeout)` effectue l'appel au SDK.
+    """
+    breaker = _guarded("embedding", model)
+    timeout = (deadline or Deadline()).timeout(EMBEDDING_TIMEOUT_S)
+    expires = time.monotonic() + timeout
+    futures = [_pool.submit(fn, timeout)]
+    done, _ = wait(futures, timeout=min(EMBEDDING_HEDGE_DELAY_S, timeout))
+    if not done or futures[0].exception() is not None:
+        remaining = expires - time.monotonic()
+        if remaining > 0:
+            count("embedding", model, "hedged")
+            futures.append(_pool.submit(fn, remaining))
+    error = None
+    while futures:
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            break
+        done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            futures.remove(future)
+            if future.exception() is None:
+                _record("embedding", model, breaker, None)
+                return future.result()
+            error = future.exception()
+    error = error if not futures else TimeoutError(f"Délai dépassé pour {model}")
+    _record("embedding", model, breaker, error)
+    raise UpstreamError(str(error)) from error
+
+
+def call_chat(model, fn, deadline=None):
+    """Complétion bornée dans le temps et protégée par le disjoncteur du modèle (pas de nouvel essai)"""
+    breaker = _guarded("chat", model)
+    timeout = (deadline or Deadline()).timeout(CHAT_TIMEOUT_S)
+    try:
+        result = fn(timeout)
+    except Exception as e:
+        _record("chat", model, breaker, e)
+        raise UpstreamError(str(e)) from e
+    _record("chat", model, breaker, None)
+    return result
+
+
+def call_chat_stream(model, fn, deadline=None):
+    """
+    Comme call_chat pour une complétion en flux : `fn(timeout)` ouvre le flux (une erreur lève
+    UpstreamError immédiatement), puis le disjoncteur enregistre le succès ou l'échec une fois le flux
+    lu jusqu'au bout. Une coupure en cours de lecture lève UpstreamError pendant l'itération.
+    """
+    breaker = _guarded("chat", model)
+    timeout = (deadline or Deadline()).timeout(CHAT_TIMEOUT_S)
+    try:
+        stream = fn(timeout)
+    except Exception as e:
+        _record("chat", model, breaker, e)
+        raise UpstreamError(str(e)) from e
+    return _read_stream(model, breaker, stream)
+
+
+def _read_stream(model, breaker, stream):
+    try:
+        yield from stream
+    except Exception as e:
+        _record("chat", model, breaker, e)
+        raise UpstreamError(str(e)) from e
+    _record("chat", model, breaker, None)
+
+
+async def call_embedding_async(model, coroutine_fn, deadline=None):
+    """Équivalent asynchrone de call_embedding"""
+    breaker = _guarded("embedding", model)
+    timeout = (deadline or Deadline()).timeout(EMBEDDING_TIMEOUT_S)
+    expires = time.monotonic() + timeout
+    tasks = [asyncio.ensure_future(coroutine_fn(timeout))]
+    done, _ = await asyncio.wait(tasks, timeout=min(EMBEDDING_HEDGE_DELAY_S, timeout))
+    if not done or tasks[0].exception() is not None:
+        remaining = expires - time.monotonic()
+        if remaining > 0:
+            count("embedding", model, "hedged")
+            tasks.append(asyncio.ensure_future(coroutine_fn(remaining)))
+    error = None
+    try:
+        while tasks:
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tasks.remove(task)
+                if task.exception() is None:
+                    _record("embedding", model, breaker, None)
+                    return task.result()
+                error = task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+    error = error if not tasks else TimeoutError(f"Délai dépassé pour {model}")
+    _record("embedding", model, breaker, error)
+    raise UpstreamError(str(error)) from error
+
+
+async def call_chat_async(model, coroutine_fn, deadline=None):
+    """Équivalent asynchrone de call_chat"""
+    breaker = _guarded("chat", model)
+    timeout = (deadline or Deadline()).timeout(CHAT_TIMEOUT_S)
+    try:
+        result = await asyncio.wait_for(coroutine_fn(timeout), timeout)
+    except Exception as e:
+        _record("chat", model, breaker, e)
+        raise UpstreamError(str(e)) from e
+    _record("chat", model, breaker, None)
+    return result
@@ -0,0 +1,146 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+# Index vectoriel "numpy" : une matrice de vecteurs normalisés et un fichier meta.json pour les
+# documents et métadonnées.
+# - float32 : vectors.npy, ouvert en mémoire partagée (memmap)
+# - float16 : vectors.npy deux fois plus petit sur disque
+# - int8 : codes quantifiés (codes.npy + scales.npy) seulement, quatre fois plus petits ; avec
+#   rescore=True, une copie float16 (vectors.npy) sert à re-calculer le score des meilleurs candidats
+# NumPy n'a pas de produit BLAS en float16/int8 : ces matrices sont converties en float32 par blocs
+# de SCORE_BLOCK_ROWS lignes à chaque recherche. Le memmap reste la seule copie complète (pages
+# partagées entre workers et relues depuis le disque) : la mémoire est réduite comme le disque.
+VECTORS_FILE = "vectors.npy"
+CODES_FILE = "codes.npy"
+SCALES_FILE = "scales.npy"
+META_FILE = "meta.json"
+SUPPORTED_DTYPES = {"float32", "float16", "int8"}
+# Nombre de candidats re-scorés en précision flottante (int8 avec rescore) : top_k * RESCORE_FACTOR
+RESCORE_FACTOR = 4
+# Lignes converties en float32 à la fois (float16/int8) : ~8 Mo temporaires en 1024 dimensions
+SCORE_BLOCK_ROWS = 2048
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize_int8(matrix):
+    """Quantification symétrique par ligne : vecteur ~= codes * scale"""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def write_vector_index(index_dir, ids, documents, metadatas, embeddings, embedding_model, dtype="float32", rescore=False):
+    """
+    Écrit l'index dans un dossier temporaire puis le met en place par renommage.
+    `rescore` (int8 seulement) : conserve aussi les vecteurs en float16 pour re-scorer les candidats.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Type de stockage non supporté : {dtype}")
+    index_dir = Path(index_dir)
+    tmp_dir = index_dir.parent / (index_dir.name + "_new")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    matrix = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    if dtype == "int8":
+        codes, scales = quantize_int8(matrix)
+        np.save(tmp_dir / CODES_FILE, codes)
+        np.save(tmp_dir / SCALES_FILE, scales)
+        if rescore:
+            np.save(tmp_dir / VECTORS_FILE, matrix.astype(np.float16))
+    else:
+        np.save(tmp_dir / VECTORS_FILE, matrix.astype(dtype))
+    meta = {
+        "embedding_model": embedding_model,
+        "dimensions": int(matrix.shape[1]) if len(matrix) else 0,
+        "dtype": dtype,
+        "count": len(ids),
+        # Stockage en colonnes : plus compact qu'une liste de dictionnaires
+        "ids": list(ids),
+        "documents": list(documents),
+        "titles": [m.get("title", "") for m in metadatas],
+        "urls": [m.get("url", "") for m in metadatas],
+        "modified": [m.get("modified", "") for m in metadatas],
+    }
+    with open(tmp_dir / META_FILE, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    if index_dir.exists():
+        shutil.rmtree(index_dir)
+    tmp_dir.rename(index_dir)
+
+
+class VectorIndex:
+    """Recherche par produit scalaire (exacte en float32/float16, approchée en int8)"""
+
+    def __init__(self, index_dir):
+        index_dir = Path(index_dir)
+        with open(index_dir / META_FILE, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.vectors = self.codes = self.scales = None
+        if (index_dir / VECTORS_FILE).exists():
+            self.vectors = np.load(index_dir / VECTORS_FILE, mmap_mode="r")
+        if self.meta["dtype"] == "int8":
+            self.codes = np.load(index_dir / CODES_FILE, mmap_mode="r")
+            self.scales = np.load(index_dir / SCALES_FILE)
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def rows(self, start=0, stop=None):
+        """Vecteurs [start:stop] en float32 (décodés depuis float16/int8)"""
+        if self.codes is not None:
+            return np.asarray(self.codes[start:stop], dtype=np.float32) * self.scales[start:stop, None]
+        return np.asarray(self.vectors[start:stop], dtype=np.float32)
+
+    def scores(self, query):
+        if self.codes is None and self.vectors.dtype == np.float32:
+            return self.vectors @ query
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            stop = start + SCORE_BLOCK_ROWS
+            if self.codes is not None:
+                scores[start:stop] = (np.asarray(self.codes[start:stop], dtype=np.float32) @ query) * self.scales[start:stop]
+            else:
+                scores[start:stop] = np.asarray(self.vectors[start:stop], dtype=np.float32) @ query
+        return scores
+
+    def search(self, query_embedding, top_k):
+        """Retourne [(position, score)] des top_k vecteurs les plus proches, du plus au moins proche"""
+        if not len(self):
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self.scores(query)
+        rescore = self.codes is not None and self.vectors is not None
+        candidates = min(top_k * RESCORE_FACTOR if rescore else top_k, len(scores))
+        best = np.argpartition(-scores, candidates - 1)[:candidates]
+        if rescore:
+            # Re-scoring en précision flottante des meilleurs candidats quantifiés
+            best = np.sort(best)
+            scores = np.zeros(len(scores), dtype=np.float32)
+            scores[best] = np.asarray(self.vectors[best], dtype=np.float32) @ query
+        best = best[np.argsort(-scores[best])][:top_k]
+        return [(int(i), float(scores[i])) for i in best]
+
+    def passage(self, position):
+        meta = self.meta
+        return {
+            "id": meta["ids"][position],
+            "content": meta["documents"][position],
+            "modified": meta["modified"][position],
+            "title": meta["titles"][position],
+            "url": meta["urls"][position],
+        }
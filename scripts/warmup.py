@@ -0,0 +1,177 @@
+"""
+Démarrage à chaud : au lancement du backend, les configs et les index des clients sont chargés
+en arrière-plan, les clients les plus sollicités d'abord (d'après leurs questions récentes,
+comptées par question_stats.py).
+/ready ne répond 200 qu'une fois les clients "chauds" chargés, pour que le load balancer
+attende la fin du démarrage avant d'envoyer du trafic.
+
+Réglages par variables d'environnement :
+- CHATBOT_WARMUP : "1" pour activer le démarrage à chaud (désactivé par défaut, /ready répond alors 200)
+- CHATBOT_WARMUP_WORKERS : nombre de clients chargés en parallèle
+- CHATBOT_WARMUP_HOT_CLIENTS : nombre de clients (les plus actifs) à charger avant d'être prêt
+- CHATBOT_WARMUP_DAYS : fenêtre de trafic utilisée pour classer les clients
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from chatbot_requete import get_client_settings, warm_indexes
+import question_stats
+from collection_registry import registry
+from question_log import read_page
+
+CLIENTS_PATH = Path(os.environ.get("CHATBOT_CLIENTS_PATH", "/root/chatbot-wp-declic/data/clients/"))
+WARMUP_ENABLED = os.environ.get("CHATBOT_WARMUP", "0") == "1"
+WARMUP_WORKERS = int(os.environ.get("CHATBOT_WARMUP_WORKERS", "4"))
+WARMUP_HOT_CLIENTS = int(os.environ.get("CHATBOT_WARMUP_HOT_CLIENTS", "10"))
+WARMUP_DAYS = int(os.environ.get("CHATBOT_WARMUP_DAYS", "30"))
+# Taille des pages lues dans les logs des clients sans statistiques (question_stats.py)
+TRAFFIC_PAGE_SIZE = 500
+
+
+def discover_clients():
+    if not CLIENTS_PATH.exists():
+        return []
+    return sorted(d.name for d in CLIENTS_PATH.iterdir() if d.is_dir() and (d / "config.json").exists())
+
+
+def recent_traffic(client_id, days=WARMUP_DAYS):
+    """
+    Nombre de questions posées au client sur les `days` derniers jours : compteurs par jour de
+    question_stats, sinon lecture des mois concernés depuis la fin, jusqu'à la date limite
+    """
+    now = datetime.now()
+    cutoff = now - timedelta(days=days)
+    stats = question_stats.load(client_id)
+    if stats is not None:
+        first_day = cutoff.strftime("%Y-%m-%d")
+        return sum(count for day, count in stats["by_day"].items() if day >= first_day)
+    total = 0
+    month = datetime(now.year, now.month, 1)
+    while month >= datetime(cutoff.year, cutoff.month, 1):
+        try:
+            total += count_since(client_id, month.strftime("%Y"), month.strftime("%m"), cutoff.isoformat())
+        except (OSError, ValueError):
+            pass
+        month = datetime(month.year - (month.month == 1), (month.month - 2) % 12 + 1, 1)
+    return total
+
+
+def count_since(client_id, year, month, since):
+    """Entrées du mois postérieures à `since`, lues des plus récentes aux plus anciennes"""
+    total, cursor = 0, None
+    while True:
+        entries, cursor = read_page(client_id, year, month, TRAFFIC_PAGE_SIZE, cursor=cursor)
+        for entry in entries:
+            if entry.get("timestamp", "") < since:
+                return total
+            total += 1
+        if cursor is None:
+            return total
+
+
+class Warmer:
+    def __init__(self, enabled=WARMUP_ENABLED, workers=WARMUP_WORKERS, hot_clients=WARMUP_HOT_CLIENTS):
+        self.enabled = enabled
+        self.workers = workers
+        self.hot_clients = hot_clients
+        self.states = {}
+        self.hot = []
+        self.discovered = False
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Lance le préchargement en arrière-plan (une seule fois par processus)"""
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            traffic = {client_id: recent_traffic(client_id) for client_id in discover_clients()}
+            order = sorted(traffic, key=lambda client_id: traffic[client_id], reverse=True)
+            with self._lock:
+                self.states = {client_id: "pending" for client_id in order}
+                # Sans trafic récent, aucun client n'est attendu pour être prêt
+                self.hot = [client_id for client_id in order if traffic[client_id] > 0][:self.hot_clients]
+                self.discovered = True
+            print(f"🔥 Démarrage à chaud : {len(order)} clients, {len(self.hot)} prioritaires")
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="warmup") as pool:
+                list(pool.map(self._warm, order))
+        except Exception as e:
+            print(f"Erreur lors du démarrage à chaud : {e}")
+            with self._lock:
+                self.discovered = True
+        self.finished_at = time.time()
+        print(f"🔥 Démarrage à chaud terminé en {self.finished_at - self.started_at:.1f} s")
+
+    def preload_shared(self):
+        """
+        Avant le fork des workers (gunicorn.conf.py) : charge de façon synchrone les index
+        en lecture seule (numpy, BM25), hérités ensuite par tous les workers. Les collections
+        Chroma (SQLite) ne peuvent pas être partagées : chaque worker les ouvre après le fork.
+        """
+        if not self.enabled:
+            return
+        start = time.time()
+        clients = sorted(discover_clients(), key=recent_traffic, reverse=True)
+        for client_id in clients:
+            if registry.snapshot()["open"] >= registry.max_handles:
+                break
+            try:
+                warm_indexes(get_client_settings(client_id), chroma=False)
+            except Exception as e:
+                print(f"Préchargement impossible pour {client_id} : {e}")
+        print(f"🔥 Index partagés préchargés en {time.time() - start:.1f} s")
+
+    def _warm(self, client_id):
+        # Pas d'éviction des clients déjà chargés : on s'arrête quand le registre est plein
+        if registry.snapshot()["open"] >= registry.max_handles:
+            self._set_state(client_id, "skipped")
+            return
+        self._set_state(client_id, "loading")
+        try:
+            warm_indexes(get_client_settings(client_id))
+            self._set_state(client_id, "ready")
+        except Exception as e:
+            print(f"Démarrage à chaud impossible pour {client_id} : {e}")
+            self._set_state(client_id, "error")
+
+    def _set_state(self, client_id, state):
+        with self._lock:
+            self.states[client_id] = state
+
+    def ready(self):
+        """Prêt quand les clients prioritaires sont chargés (ou en erreur, pour ne pas bloquer)"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            return self.discovered and all(self.states.get(c) in ("ready", "error", "skipped") for c in self.hot)
+
+    def snapshot(self):
+        ready = self.ready()
+        with self._lock:
+            counts = {}
+            for state in self.states.values():
+                counts[state] = counts.get(state, 0) + 1
+            return {
+                "enabled": self.enabled,
+                "ready": ready,
+                "clients": counts,
+                "hot": {client_id: self.states.get(client_id) for client_id in self.hot},
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+# Préchargement partagé par tout le processus
+warmer = Warmer()